@@ -0,0 +1,78 @@
+"""
+Compares the decoding loop of the FeedBack model (tf.while_loop, trained XLA compiled)
+with the former Python-unrolled loop for several label widths.
+
+Run from the Experiments directory:
+    python -m benchmarks.feedback
+"""
+
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from experiments_package.models.autoregressive import FeedBack
+
+LABEL_WIDTHS = [5, 14, 28]
+BATCH_SIZE = 32
+WINDOW_WIDTH = 10
+NUM_FEATURES = 87
+UNITS = 32
+STEPS = 50
+
+
+class UnrolledFeedBack(FeedBack):
+    """The former implementation, that unrolls the decoding loop in Python"""
+
+    def call(self, inputs, training=None, mask=None):
+        predictions = []
+        prediction, state = self.warmup(inputs)
+        predictions.append(prediction)
+        for n in range(1, self.out_steps):
+            x, state = self.lstm_cell(prediction, states=state, training=training)
+            prediction = self.dense(x)
+            predictions.append(prediction)
+        return tf.transpose(tf.stack(predictions), [1, 0, 2])
+
+
+def _measure(function, steps=STEPS):
+    """Time of the first call (tracing and compiling) and the average time of the following calls in ms"""
+    before = time.perf_counter()
+    function()
+    first = time.perf_counter() - before
+    before = time.perf_counter()
+    for _ in range(steps):
+        function()
+    return first * 1000, (time.perf_counter() - before) * 1000 / steps
+
+
+def main():
+    inputs = tf.random.normal((BATCH_SIZE, WINDOW_WIDTH, NUM_FEATURES))
+    print(
+        f"{'label width':>11} {'model':>9} {'first train step':>17} {'train step':>11} "
+        f"{'first compiled call':>20} {'compiled call':>14} {'eager call':>11}"
+    )
+    for label_width in LABEL_WIDTHS:
+        labels = tf.random.normal((BATCH_SIZE, label_width, NUM_FEATURES))
+        unrolled = UnrolledFeedBack(UNITS, label_width, NUM_FEATURES)
+        unrolled(inputs)
+        unrolled.compile(loss="mse", optimizer="adam")
+        looped = FeedBack(UNITS, label_width, NUM_FEATURES)
+        looped(inputs)
+        looped.set_weights(unrolled.get_weights())
+        looped.compile(loss="mse", optimizer="adam", jit_compile=True)
+        np.testing.assert_allclose(looped(inputs), unrolled(inputs), rtol=1e-5, atol=1e-5)
+
+        for name, model, jit_compile in [("unrolled", unrolled, False), ("loop+XLA", looped, True)]:
+            first_step, step = _measure(lambda: model.train_on_batch(inputs, labels))
+            compiled = tf.function(model.__call__, jit_compile=jit_compile)
+            first_call, call = _measure(lambda: compiled(inputs))
+            _, eager_call = _measure(lambda: model(inputs), steps=10)
+            print(
+                f"{label_width:>11} {name:>9} {first_step:>15.0f}ms {step:>9.2f}ms "
+                f"{first_call:>18.0f}ms {call:>12.2f}ms {eager_call:>9.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Measures the memory of the stages from the imputed features CSV to the tensors of an experiment:
+the peak RSS of the process (sampled with psutil) and the peak of the Python allocations
+(tracemalloc, which also sees the numpy and pandas buffers) while each stage runs.
+
+--stores replicates the stores of the CSV into a temporary CSV with that many stores,
+which is loaded with all stores like SingleOutput-AllStores does.
+
+Run from the Experiments directory:
+    python -m benchmarks.memory
+    python -m benchmarks.memory --stores 20
+"""
+
+import argparse
+import dataclasses
+import gc
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+import psutil
+
+from experiments_package.general.config import ALL_STORES
+from experiments_package.general import data as data_module
+from main import get_experiment
+
+SAMPLE_INTERVAL = 0.005
+MB = 1024 ** 2
+
+
+class PeakMemory:
+    """Peak RSS and peak traced allocations between entering and leaving"""
+
+    def __init__(self):
+        self.process = psutil.Process()
+        self.peak_rss = 0
+        self._running = False
+
+    def _sample(self):
+        while self._running:
+            self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+            time.sleep(SAMPLE_INTERVAL)
+
+    def __enter__(self):
+        gc.collect()
+        tracemalloc.reset_peak()
+        self.start_rss = self.process.memory_info().rss
+        self.peak_rss = self.start_rss
+        self.start_traced = tracemalloc.get_traced_memory()[0]
+        self._running = True
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._running = False
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+        self.end_rss = self.process.memory_info().rss
+        self.peak_traced = tracemalloc.get_traced_memory()[1] - self.start_traced
+
+
+def _write_scaled_csv(data_origin, stores, folder):
+    """The CSV with its stores copied under new ids until there are `stores` stores"""
+    original = pd.read_csv(data_origin)
+    store_ids = original["StoreID"].unique()
+    copies = []
+    for copy in range(-(-stores // len(store_ids))):
+        copies.append(original.assign(StoreID=original["StoreID"] + copy * 1000))
+    scaled = pd.concat(copies, ignore_index=True)
+    scaled = scaled[scaled["StoreID"].isin(scaled["StoreID"].unique()[:stores])]
+    path = os.path.join(folder, os.path.basename(data_origin))
+    scaled.to_csv(path, index=False)
+    return path
+
+
+def _stages(options):
+    yield "parse + pivot CSV", lambda: data_module._add_fourier_features(data_module._load_data(options.data_origin))
+    # loads the prepared data through the cache, so the next stages only measure their own work
+    data_module._load_prepared_data(options.data_origin)
+    state = {}
+
+    def window():
+        state["window_generator"] = data_module.get_window_dataset(options)
+
+    def pipeline():
+        for _ in state["window_generator"].train:
+            pass
+
+    yield "windowed float32 buffer", window
+    yield "train pipeline (1 epoch)", pipeline
+    yield "sequential inputs", lambda: state["window_generator"].get_all_inputs_sequentially()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stores", type=int, default=None, help="stores of the replicated CSV")
+    args = parser.parse_args()
+
+    options = get_experiment("SingleOutput").dataset_options
+    with tempfile.TemporaryDirectory() as folder:
+        if args.stores:
+            options = dataclasses.replace(
+                options, data_origin=_write_scaled_csv(options.data_origin, args.stores, folder), store_ids=ALL_STORES
+            )
+        import tensorflow  # noqa: F401, not part of the first stage
+
+        tracemalloc.start()
+        print(f"{'stage':<26} {'peak RSS':>10} {'RSS growth':>11} {'peak traced':>12}")
+        for name, stage in _stages(options):
+            with PeakMemory() as memory:
+                stage()
+            print(
+                f"{name:<26} {memory.peak_rss / MB:>8.1f}MB {(memory.end_rss - memory.start_rss) / MB:>9.1f}MB "
+                f"{memory.peak_traced / MB:>10.1f}MB"
+            )
+        tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
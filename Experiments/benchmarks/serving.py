@@ -0,0 +1,131 @@
+"""
+Load test of the forecast service: sends forecast requests with the features of the last days of the data
+over several keep-alive connections at once and reports the p50/p99 latency, the requests per second and
+the average micro-batch size of the service for every concurrency.
+
+Start the service first, e.g.:
+    python main.py serve SingleOutput/Dense
+
+Run from the Experiments directory:
+    python -m benchmarks.serving --model SingleOutput/Dense
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import quote
+
+import numpy as np
+
+from experiments_package.general.config import USED_STORE_ID
+
+DATA_ORIGIN = "./../Data/merged_cleaned_FE_imputed(v)_w.csv"
+CONCURRENCIES = [1, 8, 32, 128]
+REQUESTS = 1000
+
+
+async def _request(reader, writer, method, path, body=b""):
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = (await reader.readline()).strip()
+        if not line:
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    response = json.loads(await reader.readexactly(length))
+    if status != 200:
+        raise RuntimeError(f"{method} {path}: {status} {response}")
+    return response
+
+
+async def _get(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return await _request(reader, writer, "GET", path)
+    finally:
+        writer.close()
+
+
+def _make_payloads(description, data_origin):
+    """A request per store with the last input_width days of the data"""
+    from experiments_package.general.data import _load_prepared_data
+
+    data = _load_prepared_data(data_origin)
+    payloads = []
+    for store_id in description["store_ids"] or [USED_STORE_ID]:
+        days = data[data["StoreID"] == store_id][description["columns"]].tail(description["input_width"])
+        payloads.append(json.dumps({
+            "store_id": store_id if description["store_ids"] else None,
+            "days": days.astype(float).to_dict(orient="records"),
+        }).encode())
+    return payloads
+
+
+async def _load_test(host, port, path, payloads, concurrency, requests):
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for number in remaining:
+                before = time.perf_counter()
+                await _request(reader, writer, "POST", path, payloads[number % len(payloads)])
+                latencies.append(time.perf_counter() - before)
+        finally:
+            writer.close()
+
+    before = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return latencies, time.perf_counter() - before
+
+
+def _get_model_stats(stats, experiment, model):
+    return next(entry for entry in stats if (entry["experiment"], entry["model"]) == (experiment, model))
+
+
+async def main(args):
+    experiment, _, model = args.model.partition("/")
+    descriptions = await _get(args.host, args.port, "/models")
+    description = next(
+        (entry for entry in descriptions if (entry["experiment"], entry["model"]) == (experiment, model)), None
+    )
+    if description is None:
+        served = [f"{entry['experiment']}/{entry['model']}" for entry in descriptions]
+        raise SystemExit(f"{args.model} is not served, served are {served}")
+
+    payloads = _make_payloads(description, args.data)
+    path = f"/forecast/{quote(experiment)}/{quote(model)}"
+    # warms up the connections and the model
+    await _load_test(args.host, args.port, path, payloads, 4, 50)
+
+    print(f"{'concurrency':>11} {'p50':>9} {'p99':>9} {'requests/s':>11} {'batch size':>11}")
+    for concurrency in args.concurrency:
+        before = _get_model_stats(await _get(args.host, args.port, "/stats"), experiment, model)
+        latencies, duration = await _load_test(args.host, args.port, path, payloads, concurrency, args.requests)
+        after = _get_model_stats(await _get(args.host, args.port, "/stats"), experiment, model)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        batch_size = (after["requests"] - before["requests"]) / max(1, after["batches"] - before["batches"])
+        print(
+            f"{concurrency:>11} {p50:>7.2f}ms {p99:>7.2f}ms {len(latencies) / duration:>11.0f} {batch_size:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="SingleOutput/Dense", help="served model as <experiment>/<model>")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCIES,
+                        help="connections that send requests at once")
+    parser.add_argument("--requests", type=int, default=REQUESTS, help="requests per concurrency")
+    parser.add_argument("--data", default=DATA_ORIGIN, help="imputed features CSV the requests are made from")
+    asyncio.run(main(parser.parse_args()))
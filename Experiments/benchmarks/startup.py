@@ -0,0 +1,35 @@
+"""
+Measures the wall-clock time of CLI commands that should not load data or TensorFlow.
+
+Run from the Experiments directory:
+    python -m benchmarks.startup
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+
+COMMANDS = [
+    ["main.py", "--help"],
+    ["main.py", "get-experiments"],
+]
+REPETITIONS = 5
+
+
+def _measure(command):
+    durations = []
+    for _ in range(REPETITIONS):
+        before = time.perf_counter()
+        subprocess.run([sys.executable] + command, check=True, capture_output=True)
+        durations.append(time.perf_counter() - before)
+    return statistics.median(durations)
+
+
+def main():
+    for command in COMMANDS:
+        print(f"python {' '.join(command):<30} {_measure(command):>6.3f}s (median of {REPETITIONS})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Compares the batches per second of the windowing backends of the
+WindowGenerator for the window sizes used in the experiments.
+
+Run from the Experiments directory:
+    python -m benchmarks.windowing
+"""
+
+import dataclasses
+import time
+
+from experiments_package.general.data import get_window_dataset
+from main import get_experiment
+
+EXPERIMENTS = ["SingleOutput", "SingleOutput-7Days", "MultiStep"]
+BACKENDS = ["keras", "numpy"]
+EPOCHS = 20
+
+
+def _batches_per_second(window_generator, epochs=EPOCHS):
+    """Time for building the training pipeline and iterating it for some epochs."""
+    before = time.perf_counter()
+    dataset = window_generator.make_dataset(window_generator.train_df)
+    batches = 0
+    for _ in range(epochs):
+        for _ in dataset:
+            batches += 1
+    return batches / (time.perf_counter() - before)
+
+
+def main():
+    print(f"{'window width':>12} {'backend':>8} {'batches/s':>10}")
+    for name in EXPERIMENTS:
+        options = get_experiment(name).dataset_options
+        for backend in BACKENDS:
+            window_generator = get_window_dataset(dataclasses.replace(options, windowing=backend))
+            # warm up the tf.data runtime
+            _batches_per_second(window_generator, epochs=1)
+            print(
+                f"{options.window_width:>12} {backend:>8} "
+                f"{_batches_per_second(window_generator):>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
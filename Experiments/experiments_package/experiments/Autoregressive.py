@@ -9,22 +9,18 @@ class Autoregressive(Experiment):
             loss=tf.keras.losses.MeanSquaredError(),
             optimizer=tf.keras.optimizers.Adam(),
             metrics=[tf.keras.metrics.MeanAbsoluteError()],
+            # the decoding loop of FeedBack is compiled with XLA
+            jit_compile=True,
         )
 
-        history = model.fit(
-            self.data.train, epochs=100, validation_data=self.data.val, verbose=0
-        )
-
-        return history
+        return self.fit(model)
 
     def get_train_settings(self):
         return {
             "Batch Size": 32,
-            "Epochs": 100,
             "Learning Rate": 0.001,
             "Optimizer": "Adam",
             "Shuffled Batches": "True",
-            "Early Stopping": "False",
             "Window Width": 10,
             "Label Width": 5,
             "Shift": 5,
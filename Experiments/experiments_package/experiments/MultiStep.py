@@ -17,20 +17,14 @@ class MultiStep(Experiment):
             metrics=[tf.keras.metrics.MeanAbsoluteError()],
         )
 
-        history = model.fit(
-            self.data.train, epochs=100, validation_data=self.data.val, verbose=0
-        )
-
-        return history
+        return self.fit(model)
 
     def get_train_settings(self):
         return {
             "Batch Size": 32,
-            "Epochs": 100,
             "Learning Rate": 0.001,
             "Optimizer": "Adam",
             "Shuffled Batches": "True",
-            "Early Stopping": "False",
             "Window Width": 10,
             "Label Width": 5,
             "Shift": 5,
@@ -0,0 +1,14 @@
+import dataclasses
+
+from experiments_package.general import ALL_STORES
+from experiments_package.experiments.SingleStepSingleOutput import SingleStepSingleOutput
+
+
+class SingleOutputAllStores(SingleStepSingleOutput):
+    """SingleOutput trained on the stacked data of all stores, with a one-hot store id feature"""
+
+    def get_train_settings(self):
+        return {**super().get_train_settings(), "Stores": ALL_STORES}
+
+    def get_dataset_options(self):
+        return dataclasses.replace(super().get_dataset_options(), store_ids=ALL_STORES)
@@ -5,6 +5,8 @@ from experiments_package.models import Baseline
 
 
 class SingleStepSingleOutput(Experiment):
+    tunable = True
+
     def compile_and_fit(self, model):
         model.compile(
             loss=tf.keras.losses.MeanSquaredError(),
@@ -12,23 +14,17 @@ class SingleStepSingleOutput(Experiment):
             metrics=[tf.keras.metrics.MeanAbsoluteError()],
         )
 
-        history = model.fit(
-            self.data.train, epochs=100, validation_data=self.data.val, verbose=0
-        )
-
-        return history
+        return self.fit(model)
 
     def get_train_settings(self):
         return {
             "Batch Size": 32,
-            "Epochs": 100,
             "Learning Rate": 0.001,
             "Optimizer": "Adam",
             "Shuffled Batches": "True",
-            "Early Stopping": "False",
-            "Window Width": 3,
-            "Label Width": 1,
-            "Shift": 1,
+            "Window Width": self.dataset_options.window_width,
+            "Label Width": self.dataset_options.label_width,
+            "Shift": self.dataset_options.shift,
             "Predicted Labels": ProductIds.BENS_LUNCHTIME.value,
         }
 
@@ -54,20 +50,33 @@ class SingleStepSingleOutput(Experiment):
         )
 
     def get_models(self):
+        # the model inputs follow the dataset options, which `tune` may change
+        window_width = self.dataset_options.window_width
+        feature_size = len(self.data.column_indices)
         return {
             "Persistence": Baseline(
                 label_index=self.data.column_indices[ProductIds.BENS_LUNCHTIME.value],
                 label_width=1,
+                **self.get_hyperparameters("Persistence"),
             ),
             "Linear": single_step.Linear(
-                window_width=3, label_width=1, feature_size=87
+                window_width=window_width, label_width=1, feature_size=feature_size,
+                **self.get_hyperparameters("Linear"),
+            ),
+            "Dense": single_step.Dense(
+                window_width=window_width, label_width=1, feature_size=feature_size,
+                **self.get_hyperparameters("Dense"),
             ),
-            "Dense": single_step.Dense(window_width=3, label_width=1, feature_size=87),
             "Multi Step Dense": single_step.MultiStepDense(
-                window_width=3, label_width=1, feature_size=87
+                window_width=window_width, label_width=1, feature_size=feature_size,
+                **self.get_hyperparameters("Multi Step Dense"),
             ),
             "Convolutional": single_step.Convolutional(
-                window_width=3, label_width=1, feature_size=87
+                window_width=window_width, label_width=1, feature_size=feature_size,
+                **self.get_hyperparameters("Convolutional"),
+            ),
+            "RNN": single_step.RNN(
+                window_width=window_width, label_width=1, feature_size=feature_size,
+                **self.get_hyperparameters("RNN"),
             ),
-            "RNN": single_step.RNN(window_width=3, label_width=1, feature_size=87),
         }
@@ -7,3 +7,4 @@ from .SingleOutputWithoutWeather import SingleOutputWithoutWeather
 from .MultiStepWithoutWeather import MultiStepWithoutWeather
 from .SingleOutputNoIds import SingleOutputNoIds
 from .SingleOutput_7days import SingleOutput7Days
+from .SingleOutputAllStores import SingleOutputAllStores
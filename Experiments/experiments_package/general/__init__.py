@@ -1,4 +1,30 @@
-from .analysis import save_history_plot
-from .combine_results import combine_results
-from .config import ProductIds, DatasetOptions
-from .experiment import Experiment
+"""
+The modules are only imported on first access of their members,
+so e.g. listing experiments doesn't load TensorFlow and matplotlib.
+"""
+
+import importlib
+
+# member => module
+_LAZY_MEMBERS = {
+    "save_history_plot": ".analysis",
+    "backtest": ".backtesting",
+    "combine_results": ".combine_results",
+    "ALL_STORES": ".config",
+    "ProductIds": ".config",
+    "DatasetOptions": ".config",
+    "TrainingOptions": ".config",
+    "Experiment": ".experiment",
+    "run_in_parallel": ".runner",
+    "serve": ".serving",
+    "load_search_space": ".tuning",
+    "tune": ".tuning",
+}
+
+__all__ = list(_LAZY_MEMBERS.keys())
+
+
+def __getattr__(name):
+    if name not in _LAZY_MEMBERS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_LAZY_MEMBERS[name], __name__), name)
@@ -3,14 +3,14 @@ General functions for creating plots and
 statistics about experiments and model trainings.
 """
 
-from typing import Any, Dict
+import weakref
+from typing import Any, Dict, Optional
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-from .config import ProductIds, denormalize_list
-from .data import get_all_product_ids, get_no_sushi_in_product
+from .config import ProductIds
+from .data import catalog
 from .performance import (
     get_model_size_byte,
     get_non_trainable_params,
@@ -18,8 +18,15 @@ from .performance import (
 )
 from .window_generator import WindowGenerator
 
+PREDICTION_BATCH_SIZE = 1024
+
+# model => (window generator, store id => SequentialPredictions), entries vanish with the model
+_prediction_cache = weakref.WeakKeyDictionary()
+
 
 def save_history_plot(history, where):
+    import matplotlib.pyplot as plt
+
     plt.clf()
     plt.plot(history.history["loss"], label="Train")
     plt.plot(history.history["val_loss"], label="Validation")
@@ -39,8 +46,9 @@ def create_results_table(
         window_generator: WindowGenerator,
         train_settings: Dict[str, str],
         models: Dict[str, Any],
+        training_stats: Optional[Dict[str, Dict[str, Any]]] = None,
 ):
-    feature_names = str(list(window_generator.train_df.columns.values)),
+    feature_names = str(window_generator.columns),
     train_set_instances = window_generator.train_samples,
     valid_set_instances = window_generator.val_samples,
     test_set_instances = window_generator.test_samples,
@@ -62,9 +70,11 @@ def create_results_table(
 
     # The Individual Model Settings
     for name, model in models.items():
-        performance_stats.at[
-            name, ("Timing", "Latency (ms/observation)")
-        ] = performance.get_timing(name)
+        for setting, value in (training_stats or {}).get(name, {}).items():
+            performance_stats.at[name, ("Training Settings", setting)] = value
+
+        for measurement, value in performance.get_timing(name).items():
+            performance_stats.at[name, ("Timing", measurement)] = value
 
         performance_stats.at[name, ("Model", "Summary")] = _get_summary_as_string(model)
         performance_stats.at[name, ("Model", "Name")] = name
@@ -82,6 +92,11 @@ def create_results_table(
         performance_stats.at[name, ("Performance", "Avg. Sushi wasted /day")] = wasted
         performance_stats.at[
             name, ("Performance", "Avg. sushi not enough /day")] = not_enough
+        if window_generator.store_ids is not None:
+            for store_id, (wasted, not_enough) in get_sushi_stats_per_store(model, window_generator).items():
+                performance_stats.at[name, ("Performance", f"Avg. Sushi wasted /day Store {store_id}")] = wasted
+                performance_stats.at[
+                    name, ("Performance", f"Avg. sushi not enough /day Store {store_id}")] = not_enough
 
     # Move Model name to first column
     first_column = performance_stats.pop(("Model", "Name"))
@@ -90,61 +105,152 @@ def create_results_table(
     return performance_stats.reset_index(drop=True)
 
 
-def get_sushi_stats(model, window_generator: WindowGenerator):
-    product_ids = get_all_product_ids()
-    product_ids = [p_id for p_id in product_ids if p_id in window_generator.column_indices.keys()]
-    if window_generator.label_columns is not None:
-        product_ids = [p_id for p_id in product_ids if p_id in window_generator.label_columns]
-
-    total_days = 0
-    wasted = 0
-    not_enough = 0
-    for p_id in product_ids:
-        pred_time, predictions = get_model_predictions_sequentially_with_time(model, window_generator, label=p_id)
-        label_time, labels = window_generator.get_feature_sequentially_with_time(p_id)
-        combined_times = list(set(pred_time) & set(label_time))
-        beginning = min(combined_times)
-        end = max(combined_times)
-        pred_time = pd.Series(sorted(list(pred_time)))
-        label_time = pd.Series(sorted(list(label_time)))
-
-        pred_slice = slice(pred_time[pred_time == beginning].index[0], list(pred_time[pred_time == end].index)[-1])
-        label_slice = slice(label_time[label_time == beginning].index[0], list(label_time[label_time == end].index)[-1])
-
-        # round to integer, as we cannot produce "half sets"
-        predictions = np.rint(np.array(predictions[pred_slice])).reshape((-1,))
-        labels = np.rint(np.array(labels[label_slice])).reshape((-1,))
-
-        sushi_in_product = get_no_sushi_in_product(p_id)
-
-        wasted += np.sum(np.maximum(predictions - labels, 0)) * sushi_in_product
-        not_enough += np.sum(np.maximum(labels - predictions, 0)) * sushi_in_product
-        total_days += len(labels)
+def get_predicted_products(window_generator: WindowGenerator):
+    """(product ids, their positions in the labels) of the products the models of the window generator predict"""
+    product_ids = [p_id for p_id in catalog.product_ids if p_id in window_generator.label_columns_indices]
+    return product_ids, [window_generator.label_columns_indices[p_id] for p_id in product_ids]
 
-    if total_days == 0:
-        return 0, 0
 
-    return int(np.rint(wasted / total_days)), int(np.rint(not_enough / total_days))
+def _get_sushi_differences(model, window_generator: WindowGenerator, store_id=None):
+    """
+    Aligns the predictions and the labels of all predicted products of a store by day and returns
+    the number of sushi pieces produced too much and too little:
+    (days, product ids, wasted (days x products), not_enough (days x products))
+    """
+    product_ids, label_positions = get_predicted_products(window_generator)
+
+    predictions = get_sequential_predictions(model, window_generator, store_id)
+    pred_time = pd.DatetimeIndex(predictions.time)
+    label_time = pd.DatetimeIndex(window_generator.time_stamps)
+
+    # the last common day is left out of the comparison
+    days = pred_time.intersection(label_time)[:-1]
+
+    prediction_matrix = predictions.values[
+        pred_time.get_indexer(days)[:, np.newaxis],
+        label_positions,
+    ]
+    _, label_matrix = window_generator.get_features_sequentially_with_time(product_ids, store_id)
+    label_matrix = label_matrix[label_time.get_indexer(days)]
 
+    wasted, not_enough = get_sushi_differences(prediction_matrix, label_matrix, product_ids)
+    return days, product_ids, wasted, not_enough
 
-def get_model_predictions_sequentially_with_time(model, window_generator: WindowGenerator, label: str):
-    inputs = window_generator.get_all_inputs_sequentially()
 
-    label_index = window_generator.label_columns_indices[label]
+def get_sushi_differences(prediction_matrix, label_matrix, product_ids):
+    """
+    Number of sushi pieces produced too much and too little for denormalized predictions and labels
+    of the products: (wasted (days x products), not_enough (days x products))
+    """
+    sushi_in_product = catalog.pieces(product_ids)
 
-    # see diagram above on where time starts and ends for the labels.
-    # end of the time has to be considered as only the first of the results will get used
-    last_time_index = - window_generator.label_width + 1
-    time = window_generator.time_stamps[
-           window_generator.total_window_size - window_generator.label_width: last_time_index if last_time_index != 0 else None]
-    # Only pick the first of the labels predicted
-    predictions = denormalize_list(model(inputs)[:, 0, label_index],
-                                   window_generator.normalization_params,
-                                   label)
-    return time, predictions
+    # round to integer, as we cannot produce "half sets"
+    difference = np.rint(prediction_matrix) - np.rint(label_matrix)
+    wasted = np.maximum(difference, 0) * sushi_in_product
+    not_enough = np.maximum(-difference, 0) * sushi_in_product
+    return wasted, not_enough
+
+
+def get_sushi_stats(model, window_generator: WindowGenerator):
+    """Average sushi pieces wasted and not enough per day and product, over all stores"""
+    differences = [
+        _get_sushi_differences(model, window_generator, store_id)[2:]
+        for store_id in window_generator.store_ids or [None]
+    ]
+    return average_sushi_per_day(
+        np.concatenate([wasted for wasted, _ in differences]),
+        np.concatenate([not_enough for _, not_enough in differences]),
+    )
+
+
+def get_sushi_stats_per_store(model, window_generator: WindowGenerator) -> Dict[int, Any]:
+    """store id => average sushi pieces wasted and not enough per day and product of the store"""
+    return {
+        store_id: average_sushi_per_day(*_get_sushi_differences(model, window_generator, store_id)[2:])
+        for store_id in window_generator.store_ids
+    }
+
+
+def average_sushi_per_day(wasted, not_enough):
+    total_days = wasted.size
+    if total_days == 0:
+        return 0, 0
+
+    return int(np.rint(np.sum(wasted) / total_days)), int(np.rint(np.sum(not_enough) / total_days))
+
+
+def get_sushi_breakdown(model, window_generator: WindowGenerator, store_id=None) -> pd.DataFrame:
+    """
+    Number of sushi pieces wasted and not enough in a store for every day and product.
+    Columns: (wasted|not_enough, product id), e.g. `.sum()` gives the totals per product.
+    """
+    days, product_ids, wasted, not_enough = _get_sushi_differences(model, window_generator, store_id)
+    return pd.concat(
+        {
+            "wasted": pd.DataFrame(wasted, index=days, columns=product_ids),
+            "not_enough": pd.DataFrame(not_enough, index=days, columns=product_ids),
+        },
+        axis="columns",
+    )
+
+
+class SequentialPredictions:
+    """
+    The denormalized predictions of a model for every window of the whole dataset
+    (train, validation and test) of a store in chronological order.
+    Only the first predicted time step of every window is kept.
+
+    values => (time, #label_columns)
+    """
+
+    def __init__(self, model, window_generator: WindowGenerator, store_id=None, batch_size=PREDICTION_BATCH_SIZE):
+        inputs = window_generator.get_all_inputs_sequentially(store_id)
+
+        self.label_indices = window_generator.label_columns_indices
+        labels = list(self.label_indices.keys())
+
+        # see diagram above on where time starts and ends for the labels.
+        # end of the time has to be considered as only the first of the results will get used
+        last_time_index = - window_generator.label_width + 1
+        self.time = window_generator.time_stamps[
+                    window_generator.total_window_size - window_generator.label_width:
+                    last_time_index if last_time_index != 0 else None]
+
+        # Only pick the first of the labels predicted
+        predictions = np.ascontiguousarray(model.predict(inputs, batch_size=batch_size, verbose=0)[:, 0, :])
+        self.values = window_generator.get_normalizer(store_id).inverse_transform(predictions, labels)
+
+    def for_label(self, label: str):
+        return self.time, self.values[:, self.label_indices[label]]
+
+
+def get_sequential_predictions(model, window_generator: WindowGenerator, store_id=None) -> SequentialPredictions:
+    """Runs the model once over all windows of a store and serves the results from memory afterwards."""
+    cached = _prediction_cache.get(model)
+    if cached is None or cached[0] is not window_generator:
+        cached = (window_generator, {})
+        _prediction_cache[model] = cached
+    if store_id not in cached[1]:
+        cached[1][store_id] = SequentialPredictions(model, window_generator, store_id)
+    return cached[1][store_id]
+
+
+def clear_prediction_cache(model=None):
+    """Has to be called when the weights of a model change."""
+    if model is None:
+        _prediction_cache.clear()
+    else:
+        _prediction_cache.pop(model, None)
+
+
+def get_model_predictions_sequentially_with_time(model, window_generator: WindowGenerator, label: str,
+                                                 store_id=None):
+    return get_sequential_predictions(model, window_generator, store_id).for_label(label)
 
 
 def save_predictions_plot(model, window_generator: WindowGenerator, where: str, columns=None):
+    import matplotlib.pyplot as plt
+
     if columns is None:
         # If all columns are predicted, only this sushi type is shown
         columns = [ProductIds.BENS_LUNCHTIME.value]
@@ -153,41 +259,46 @@ def save_predictions_plot(model, window_generator: WindowGenerator, where: str,
         if window_generator.label_columns is not None:
             columns = list(set(columns) & set(window_generator.label_columns))
 
-    for i, label in enumerate(columns):
-        fig = plt.figure(figsize=(16, 4))
-        ax = fig.add_subplot(1, 1, 1)
-        ax.set_title(f"Predictions and Labels for >>{label}<<")
-
-        x, y = window_generator.get_feature_sequentially_with_time(label)
-        ax.scatter(
-            x, y,
-            edgecolors="k",
-            label="Labels",
-            c="#2ca02c",
-            s=32
-        )
-        x, y = get_model_predictions_sequentially_with_time(model, window_generator, label)
-        ax.scatter(
-            x, y,
-            marker="X",
-            edgecolors="k",
-            label="Predictions",
-            c="#ff7f0e",
-            s=32,
-        )
-
-        ax.axvline(x=window_generator.time_stamps[len(window_generator.train_df)], color='black',
-                   label='End of training data')
-        ax.axvline(x=window_generator.time_stamps[len(window_generator.val_df) + len(window_generator.train_df)],
-                   color='orange',
-                   label='end of validation data')
-        ax.legend()
-
-        image_name_parts = where.split(".")
-        image_name_parts.insert(-1, label)
-        fig.savefig(".".join(image_name_parts))
-
-        print(f" => Saved Predictions Plot {label}")
+    train_rows = window_generator.get_split_rows("train")
+    val_rows = window_generator.get_split_rows("val")
+    # one plot per label and store, for several stores the file names get the store id after the label
+    for store_id in window_generator.store_ids or [None]:
+        for i, label in enumerate(columns):
+            fig = plt.figure(figsize=(16, 4))
+            ax = fig.add_subplot(1, 1, 1)
+            store = f" in store {store_id}" if store_id is not None else ""
+            ax.set_title(f"Predictions and Labels for >>{label}<<{store}")
+
+            x, y = window_generator.get_feature_sequentially_with_time(label, store_id)
+            ax.scatter(
+                x, y,
+                edgecolors="k",
+                label="Labels",
+                c="#2ca02c",
+                s=32
+            )
+            x, y = get_model_predictions_sequentially_with_time(model, window_generator, label, store_id)
+            ax.scatter(
+                x, y,
+                marker="X",
+                edgecolors="k",
+                label="Predictions",
+                c="#ff7f0e",
+                s=32,
+            )
+
+            ax.axvline(x=window_generator.time_stamps[train_rows], color='black',
+                       label='End of training data')
+            ax.axvline(x=window_generator.time_stamps[val_rows + train_rows],
+                       color='orange',
+                       label='end of validation data')
+            ax.legend()
+
+            image_name_parts = where.split(".")
+            image_name_parts.insert(-1, label if store_id is None else f"{label}.{store_id}")
+            fig.savefig(".".join(image_name_parts))
+
+            print(f" => Saved Predictions Plot {label}")
     plt.clf()
 
 
@@ -0,0 +1,220 @@
+"""
+Rolling-origin backtesting: evaluates a model of an experiment on several consecutive test periods
+(folds) instead of the single train/validation/test split.
+
+The normalized data of the experiment is windowed once; every fold only selects index ranges of these
+windows. Fold k tests on the `horizon` windows after its origin, validates on the windows before it and
+trains on all earlier windows (expanding) or on a fixed number of them (sliding). A gap of
+`label_width - 1` windows keeps the labels of a block out of the next block.
+
+The first fold is trained from scratch, the later folds start from its weights, so they can be trained
+in parallel. The first fold has the earliest origin, so no fold starts from weights that saw its test period.
+"""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .runner import get_experiment_spec, get_worker_experiment, make_pool
+
+if TYPE_CHECKING:
+    from .experiment import Experiment
+    from .window_generator import WindowGenerator
+
+
+@dataclass
+class Fold:
+    """Index ranges of one fold over the windows of the experiment (of each store)"""
+
+    number: int
+    train: range
+    val: range
+    test: range
+
+
+def make_folds(windows: int, label_width: int, folds: int, horizon: int, val_windows: int,
+               train_windows: Optional[int] = None) -> List[Fold]:
+    """
+    Folds over `windows` chronological windows, the last fold tests on the last `horizon` windows.
+    train_windows => sliding origin with a fixed number of training windows, None => expanding origin
+    """
+    gap = label_width - 1
+    result = []
+    for number in range(folds):
+        test_start = windows - (folds - number) * horizon
+        val_start = test_start - gap - val_windows
+        train_stop = val_start - gap
+        train_start = 0 if train_windows is None else max(0, train_stop - train_windows)
+        if train_stop - train_start <= 0:
+            raise ValueError(
+                f"Not enough windows for {folds} folds with {horizon} test and {val_windows} validation windows"
+            )
+        result.append(
+            Fold(number, range(train_start, train_stop), range(val_start, val_start + val_windows),
+                 range(test_start, test_start + horizon))
+        )
+    return result
+
+
+class FoldData:
+    """
+    The `train`, `val` and `test` pipelines of a fold, in place of the WindowGenerator while fitting.
+    They gather the windows by index from the tensors of all windows, nothing is re-windowed or copied per fold.
+    With several stores the windows of a store follow each other and a fold covers its ranges in every store.
+    """
+
+    def __init__(self, inputs, labels, fold: Fold, store_count=1, batch_size=32):
+        self.inputs = inputs
+        self.labels = labels
+        self.fold = fold
+        self.store_count = store_count
+        self.batch_size = batch_size
+
+    def get_indices(self, windows: range):
+        """Indices of the windows of the range in every store"""
+        windows_per_store = len(self.inputs) // self.store_count
+        store_offsets = np.arange(self.store_count)[:, np.newaxis] * windows_per_store
+        return (store_offsets + np.arange(windows.start, windows.stop)).ravel()
+
+    def _make_dataset(self, windows: range, shuffle: bool):
+        import tensorflow as tf
+
+        indices = self.get_indices(windows)
+        dataset = tf.data.Dataset.from_tensor_slices(indices)
+        if shuffle:
+            # draw the seed from numpy like the WindowGenerator does
+            dataset = dataset.shuffle(len(indices), seed=np.random.randint(1e6))
+        return dataset.batch(self.batch_size).map(
+            lambda index: (tf.gather(self.inputs, index), tf.gather(self.labels, index))
+        ).prefetch(tf.data.AUTOTUNE)
+
+    @property
+    def train(self):
+        return self._make_dataset(self.fold.train, shuffle=True)
+
+    @property
+    def val(self):
+        return self._make_dataset(self.fold.val, shuffle=False)
+
+    @property
+    def test(self):
+        return self._make_dataset(self.fold.test, shuffle=False)
+
+
+def evaluate_fold(model, data: FoldData, window_generator: "WindowGenerator") -> Dict[str, Any]:
+    """
+    MSE and MAE of the normalized test windows and the sushi waste of the first predicted day,
+    also per store for several stores
+    """
+    from .analysis import average_sushi_per_day, get_predicted_products, get_sushi_differences
+
+    predictions = model.predict(data.test, verbose=0)
+    labels = np.asarray(data.labels)[data.get_indices(data.fold.test)]
+    errors = predictions - labels
+
+    product_ids, label_positions = get_predicted_products(window_generator)
+    store_ids = window_generator.store_ids or [None]
+    # (stores, windows, products)
+    predictions = predictions[:, 0, label_positions].reshape(len(store_ids), -1, len(product_ids))
+    labels = labels[:, 0, label_positions].reshape(len(store_ids), -1, len(product_ids))
+
+    result = {
+        "MSE": float(np.mean(np.square(errors))),
+        "MAE": float(np.mean(np.abs(errors))),
+    }
+    differences = {}
+    for store_id, store_predictions, store_labels in zip(store_ids, predictions, labels):
+        normalizer = window_generator.get_normalizer(store_id)
+        differences[store_id] = get_sushi_differences(
+            normalizer.inverse_transform(store_predictions, product_ids),
+            normalizer.inverse_transform(store_labels, product_ids),
+            product_ids,
+        )
+
+    result["Avg. Sushi wasted /day"], result["Avg. sushi not enough /day"] = average_sushi_per_day(
+        np.concatenate([wasted for wasted, _ in differences.values()]),
+        np.concatenate([not_enough for _, not_enough in differences.values()]),
+    )
+    if window_generator.store_ids is not None:
+        for store_id, (wasted, not_enough) in differences.items():
+            (
+                result[f"Avg. Sushi wasted /day Store {store_id}"],
+                result[f"Avg. sushi not enough /day Store {store_id}"],
+            ) = average_sushi_per_day(wasted, not_enough)
+    return result
+
+
+def _run_fold(experiment: "Experiment", model_name: str, fold: Fold, initial_weights=None):
+    import tensorflow as tf
+
+    window_generator = experiment.data
+    inputs, labels = window_generator.get_all_windows_sequentially()
+    data = FoldData(tf.constant(inputs), tf.constant(labels), fold, window_generator.store_count)
+
+    model, training_stats = experiment.fit_on_windows(model_name, data, initial_weights)
+
+    first_label = window_generator.total_window_size - window_generator.label_width
+    time_stamps = window_generator.time_stamps
+    return model.get_weights(), {
+        "Train From": time_stamps[fold.train.start + first_label].date(),
+        "Test From": time_stamps[fold.test.start + first_label].date(),
+        "Test To": time_stamps[fold.test.stop - 1 + first_label].date(),
+        "Train Windows": len(fold.train) * window_generator.store_count,
+        "Validation Windows": len(fold.val) * window_generator.store_count,
+        "Test Windows": len(fold.test) * window_generator.store_count,
+        "Warm Start": initial_weights is not None,
+        **training_stats,
+        **evaluate_fold(model, data, window_generator),
+    }
+
+
+def _run_fold_in_worker(experiment_spec, model_name, fold, initial_weights):
+    _, result = _run_fold(get_worker_experiment(experiment_spec), model_name, fold, initial_weights)
+    return result
+
+
+def backtest(experiment: "Experiment", model_name: str, folds=5, horizon: Optional[int] = None,
+             sliding=False, jobs=1) -> pd.DataFrame:
+    """
+    Trains and evaluates the model on `folds` rolling origins and returns one row per fold with the
+    MSE, MAE, sushi waste and training statistics, followed by their mean and standard deviation.
+    horizon => test windows per fold, by default as many as the test split of the experiment has
+    sliding => train every fold on as many windows as the first fold instead of all windows before its origin
+    jobs => processes that train the warm-started folds in parallel
+    """
+    window_generator = experiment.data
+    inputs, _ = window_generator.get_all_windows_sequentially()
+    # the folds are made over the windows of one store, the stores cover the same days
+    stores = window_generator.store_count
+    windows = len(inputs) // stores
+    horizon = horizon or window_generator.test_samples // stores
+    val_windows = window_generator.val_samples // stores
+    fold_list = make_folds(windows, window_generator.label_width, folds, horizon, val_windows)
+    if sliding:
+        fold_list = make_folds(windows, window_generator.label_width, folds, horizon, val_windows,
+                               train_windows=len(fold_list[0].train))
+
+    print(f"Backtest {model_name} of {experiment.name} on {folds} folds")
+    weights, first = _run_fold(experiment, model_name, fold_list[0])
+    results = [first]
+    if jobs > 1 and folds > 2:
+        with make_pool(jobs) as executor:
+            futures = [
+                executor.submit(
+                    _run_fold_in_worker,
+                    get_experiment_spec(experiment),
+                    model_name,
+                    fold,
+                    weights,
+                )
+                for fold in fold_list[1:]
+            ]
+            results += [future.result() for future in futures]
+    else:
+        results += [_run_fold(experiment, model_name, fold, weights)[1] for fold in fold_list[1:]]
+
+    table = pd.DataFrame(results, index=[f"Fold {fold.number + 1}" for fold in fold_list])
+    aggregated = table.select_dtypes("number").agg(["mean", "std"]).rename(index={"mean": "Mean", "std": "Std"})
+    return pd.concat([table, aggregated])
@@ -5,11 +5,13 @@ several places.
 
 from dataclasses import dataclass
 from enum import Enum
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Union
 
 import numpy as np
 
 USED_STORE_ID = 4051653300272
+# DatasetOptions.store_ids of every store in the data
+ALL_STORES = "all"
 
 ALL_USED_PRODUCT_IDS = [
     '4260705920294',
@@ -74,6 +76,19 @@ ALL_USED_PRODUCT_IDS = [
 class ProductIds(Enum):
     BENS_LUNCHTIME = "4260705920294"
 
+    @property
+    def pieces(self) -> int:
+        """Number of sushi pieces in the product, looked up in the menu"""
+        from .data import catalog
+
+        return int(catalog.pieces([self.value])[0])
+
+    @property
+    def price(self) -> float:
+        from .data import catalog
+
+        return float(catalog.prices([self.value])[0])
+
 
 @dataclass
 class DatasetOptions:
@@ -83,35 +98,100 @@ class DatasetOptions:
     data_origin: str
     drop_columns: List[str]
     label_columns: Optional[List[str]] = None
+    # "keras" or "numpy", see WindowGenerator
+    windowing: str = "keras"
+    # None => USED_STORE_ID, a list of store ids or ALL_STORES. Several stores are stacked into one
+    # dataset, each normalized on its own and marked with a one-hot "Store_<id>" feature
+    store_ids: Optional[Union[List[int], str]] = None
+
 
+@dataclass
+class TrainingOptions:
+    """The training policy of Experiment.fit"""
+    max_epochs: int = 100
+    # the metric that decides about stopping, the learning rate and the best weights
+    monitor: str = "val_loss"
+    # epochs without improvement until the training stops, None => always train max_epochs
+    early_stopping_patience: Optional[int] = 10
+    # epochs without improvement until the learning rate is reduced, None => constant learning rate
+    reduce_lr_patience: Optional[int] = 5
+    reduce_lr_factor: float = 0.5
+    min_learning_rate: float = 1e-5
+    # the weights of the best epoch are restored (in memory) when the training ends
+    restore_best_weights: bool = True
 
-def normalize(data, norm_values_to_use=None):
-    norm_values_used = norm_values_to_use
-    if norm_values_to_use is None:
-        std = data.std()
-        std = std.where(lambda x: np.invert(np.isclose(x, 0)), other=0.3)
-        norm_values_used = {
-            "std": std,
-            "mean": data.mean(),
+    def get_train_settings(self) -> Dict[str, Any]:
+        """The policy as settings for the "Training Settings" of the results table"""
+        return {
+            "Epochs": self.max_epochs,
+            "Early Stopping": "False" if self.early_stopping_patience is None
+            else f"patience {self.early_stopping_patience} on {self.monitor}",
+            "Reduce LR on Plateau": "False" if self.reduce_lr_patience is None
+            else f"factor {self.reduce_lr_factor} after {self.reduce_lr_patience} epochs, min {self.min_learning_rate}",
+            "Restore Best Weights": str(self.restore_best_weights),
         }
 
-    return (data - norm_values_used["mean"]) / (
-        norm_values_used["std"]
-    ), norm_values_used
 
+class Normalizer:
+    """
+    Mean and standard deviation of every column as aligned float32 arrays, fitted once on the training data
+    and shared by the train, validation and test data and by the predictions of the models.
+    The arrays are transformed in place along their last axis, which holds all columns or the `columns` subset.
+    """
+
+    def __init__(self, columns: List[str], mean, std):
+        self.columns = [str(column) for column in columns]
+        self.column_indices = {name: i for i, name in enumerate(self.columns)}
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self._subsets = {}
+
+    @classmethod
+    def fit(cls, values: np.ndarray, columns: List[str]) -> "Normalizer":
+        """values => (time, columns), the statistics are accumulated in float64"""
+        std = np.nanstd(values, axis=0, ddof=1, dtype=np.float64)
+        # constant columns are scaled by 0.3 instead of 0
+        std = np.where(np.isclose(std, 0), 0.3, std)
+        return cls(columns, np.nanmean(values, axis=0, dtype=np.float64), std)
+
+    def _get_parameters(self, columns=None):
+        """(mean, std) of the columns, the subsets are looked up once"""
+        if columns is None:
+            return self.mean, self.std
+        columns = tuple(columns)
+        if columns not in self._subsets:
+            positions = [self.column_indices[column] for column in columns]
+            self._subsets[columns] = (self.mean[positions], self.std[positions])
+        return self._subsets[columns]
+
+    @staticmethod
+    def _as_float32(values):
+        # in place for writable float32 arrays, other data (lists, tensors, float64) is converted once
+        values = np.asarray(values)
+        if values.dtype != np.float32 or not values.flags.writeable:
+            values = values.astype(np.float32)
+        return values
+
+    def transform(self, values, columns: Optional[List[str]] = None) -> np.ndarray:
+        """(values - mean) / std"""
+        mean, std = self._get_parameters(columns)
+        values = self._as_float32(values)
+        values -= mean
+        values /= std
+        return values
 
-def denormalize(data, used_normalization, labels=None):
-    if labels is None:
-        labels = slice(None)
-    return (
-            data * used_normalization["std"][labels]
-            + used_normalization["mean"][labels]
-    )
+    def inverse_transform(self, values, columns: Optional[List[str]] = None) -> np.ndarray:
+        """values * std + mean"""
+        mean, std = self._get_parameters(columns)
+        values = self._as_float32(values)
+        values *= std
+        values += mean
+        return values
 
+    def to_dict(self) -> Dict[str, Any]:
+        # float32 values are exact as (64 bit) json floats
+        return {"columns": self.columns, "mean": self.mean.tolist(), "std": self.std.tolist()}
 
-def denormalize_list(data_list, used_normalization, label):
-    data_list = np.array(data_list)
-    return (
-            data_list * used_normalization["std"][label]
-            + used_normalization["mean"][label]
-    )
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> "Normalizer":
+        return cls(values["columns"], values["mean"], values["std"])
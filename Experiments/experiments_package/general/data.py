@@ -2,28 +2,81 @@
 Methods that are used for handling and loading the dataset initially.
 """
 
+import glob
+import hashlib
+import json
 import math
+import os
+from dataclasses import asdict
+from typing import List
 
 import numpy as np
 import pandas as pd
 
-from .config import USED_STORE_ID, DatasetOptions, normalize
+from .config import ALL_STORES, USED_STORE_ID, DatasetOptions, Normalizer
 from .window_generator import WindowGenerator
 
+# has to be increased whenever _load_data or _add_fourier_features change their output
+DATASET_CACHE_VERSION = 3
+CACHE_FOLDER = ".cache"
+
+# types of the columns of the imputed features CSV, the other columns are read as float32
+ID_COLUMNS = ["StoreID", "ProductID"]
+CALENDAR_TYPES = {
+    "Year": "int16",
+    "Month": "int8",
+    "DayoftheMonth": "int8",
+    "WeekoftheMonth": "int8",
+    "DayoftheWeek": "int8",
+    "WeekoftheYear": "int8",
+    "DayoftheYear": "int16",
+}
+FLAG_PREFIXES = ("is", "Season_", "weather_")
+
+# cache file => dataset, shared between the experiments of one process
+_loaded_datasets = {}
+# (path, size, modification time) => sha256 of the file
+_file_hashes = {}
+
+
+def _get_column_types(columns):
+    types = {}
+    for column in columns:
+        if column == "Date":
+            continue
+        if column in ID_COLUMNS:
+            types[column] = "category"
+        elif column in CALENDAR_TYPES:
+            types[column] = CALENDAR_TYPES[column]
+        elif column.startswith(FLAG_PREFIXES):
+            types[column] = "bool"
+        else:
+            types[column] = "float32"
+    return types
+
 
 def _load_data(data_origin):
-    """data_origin => location of imputed features CSV"""
-    original_data = pd.read_csv(data_origin, parse_dates=["Date"])
+    """
+    data_origin => location of imputed features CSV
+    The data of all stores is kept, with one row per store and day.
+    The columns are downcast while parsing: float32 values, int8/int16 calendar numbers,
+    bool flags and categorical ids.
+    """
+    columns = pd.read_csv(data_origin, nrows=0).columns
+    original_data = pd.read_csv(data_origin, parse_dates=["Date"], dtype=_get_column_types(columns))
+    # categories are parsed as strings
+    for column in ID_COLUMNS:
+        original_data[column] = original_data[column].cat.rename_categories(pd.to_numeric)
     not_indexed = ["ProductID", "Quantity", "Price_imputed", "Year"]
     df_pivot = original_data.pivot_table(
         index=[col for col in list(original_data.columns) if col not in not_indexed],
         columns=["ProductID"],
         values="Quantity",
+        observed=True,
     )
+    del original_data
     df_pivot["total_quantity_day"] = df_pivot.sum(axis=1)
 
-    df_pivot = df_pivot.loc[df_pivot.index.get_level_values("StoreID") == USED_STORE_ID]
-    df_pivot = df_pivot.droplevel("StoreID")
     df_pivot = df_pivot.reset_index()
     df_pivot.columns = df_pivot.columns.astype(str)
 
@@ -46,8 +99,8 @@ def _add_fourier_features(
     data_copy = data.copy()
 
     for column, period in features_to_period.items():
-        data_copy[f"{column}_cos"] = np.cos(2 * np.pi * data_copy["Month"] / period)
-        data_copy[f"{column}_sin"] = np.sin(2 * np.pi * data_copy["Month"] / period)
+        data_copy[f"{column}_cos"] = np.cos(2 * np.pi * data_copy["Month"] / period).astype(np.float32)
+        data_copy[f"{column}_sin"] = np.sin(2 * np.pi * data_copy["Month"] / period).astype(np.float32)
 
     return data_copy.drop(
         features_to_period.keys(),
@@ -55,63 +108,224 @@ def _add_fourier_features(
     )
 
 
-def _get_dataset(data_origin):
-    df_pivot = _load_data(data_origin)
-    date_time = pd.to_datetime(df_pivot.pop("Date"), format="%Y-%m-%d")
-    data = _add_fourier_features(df_pivot)
-    assert len(date_time) == len(data)
-    return data, date_time
+def _hash_file(path):
+    stat = os.stat(path)
+    file_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if file_key not in _file_hashes:
+        file_hash = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                file_hash.update(block)
+        _file_hashes[file_key] = file_hash.hexdigest()
+    return _file_hashes[file_key]
+
+
+def _get_cache_file(data_origin):
+    """Cache location of the prepared data, keyed by the content of the CSV file"""
+    file_hash = hashlib.sha256(f"{_hash_file(data_origin)}{DATASET_CACHE_VERSION}".encode())
+
+    name = os.path.splitext(os.path.basename(data_origin))[0]
+    return os.path.join(os.path.dirname(data_origin), CACHE_FOLDER, f"{name}.{file_hash.hexdigest()[:16]}.parquet")
+
 
+def get_dataset_hash(dataset_options: DatasetOptions) -> str:
+    """Hash of the content of the data and of the options the windows are made with"""
+    options = json.dumps(asdict(dataset_options), sort_keys=True)
+    return hashlib.sha256(
+        f"{_get_cache_file(dataset_options.data_origin)}/{options}".encode()
+    ).hexdigest()
 
-def _split_data(data, train_frac=0.7, valid_frac=0.2, test_frac=0.1):
+
+def _load_prepared_data(data_origin):
+    """
+    The pivoted data of all stores with fourier features, including the "Date" and "StoreID" columns.
+    It is stored as parquet file next to the CSV file, so the CSV only has to be parsed and
+    pivoted again after it changed.
+    """
+    cache_file = _get_cache_file(data_origin)
+    if cache_file in _loaded_datasets:
+        return _loaded_datasets[cache_file]
+
+    if os.path.exists(cache_file):
+        # parquet doesn't keep the name of the pivoted columns
+        data = pd.read_parquet(cache_file).rename_axis(columns="ProductID")
+    else:
+        data = _add_fourier_features(_load_data(data_origin))
+
+        # only the caches of this CSV, named like in _get_cache_file
+        name = os.path.splitext(os.path.basename(data_origin))[0]
+        outdated_pattern = f"{glob.escape(name)}.{'?' * 16}.parquet"
+        for outdated_file in glob.glob(os.path.join(os.path.dirname(cache_file), outdated_pattern)):
+            os.remove(outdated_file)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        # write under a temporary name first, as parallel runs may write the same file
+        temporary_file = f"{cache_file}.{os.getpid()}.tmp"
+        data.to_parquet(temporary_file, index=False)
+        os.replace(temporary_file, cache_file)
+
+    _loaded_datasets[cache_file] = data
+    return data
+
+
+def get_store_ids(dataset_options: DatasetOptions) -> List[int]:
+    """The stores the dataset is made of"""
+    if dataset_options.store_ids is None:
+        return [USED_STORE_ID]
+    if dataset_options.store_ids == ALL_STORES:
+        return sorted(_load_prepared_data(dataset_options.data_origin)["StoreID"].unique().tolist())
+    return list(dataset_options.store_ids)
+
+
+def _get_split_rows(size, train_frac=0.7, valid_frac=0.2, test_frac=0.1):
+    """The first rows of the validation and of the test split"""
     if not math.isclose(train_frac + valid_frac + test_frac, 1):
         raise ValueError(
             f"Invalid split sizes: {train_frac} + {valid_frac} + {test_frac}"
             + f" has to be 1 but is: {train_frac + valid_frac + test_frac}"
         )
 
-    size = len(data)
-    train_df = data[0: int(size * train_frac)]
-    val_df = data[int(size * train_frac): int(size * (train_frac + valid_frac))]
-    test_df = data[int(size * (train_frac + valid_frac)):]
+    return int(size * train_frac), int(size * (train_frac + valid_frac))
+
 
-    return train_df, val_df, test_df
+def _get_store_rows(prepared_data, store_ids, data_origin):
+    """The rows of every store in the prepared data, the stores have to cover the same days"""
+    store_column = prepared_data["StoreID"].to_numpy()
+    dates = prepared_data["Date"].to_numpy()
+    store_rows = []
+    for store_id in store_ids:
+        rows = np.flatnonzero(store_column == store_id)
+        if len(rows) == 0:
+            raise ValueError(f"Store {store_id} not found in {data_origin}")
+        if store_rows and not np.array_equal(dates[rows], dates[store_rows[0]]):
+            raise ValueError(f"The stores {store_ids} don't cover the same days")
+        store_rows.append(rows)
+    return store_rows
 
 
 def get_window_dataset(dataset_options: DatasetOptions) -> WindowGenerator:
-    data, time_stamps = _get_dataset(dataset_options.data_origin)
+    """
+    Copies the features of the stores into one float32 buffer (stores, time, features) and normalizes every
+    store in place with a Normalizer fitted on its training rows. The splits are views into this buffer.
+    Several stores get a one-hot "Store_<id>" feature per store after the normalization (mean 0 and std 1).
+    """
+    # the prepared data is shared, so it must not be changed in place
+    prepared_data = _load_prepared_data(dataset_options.data_origin)
+    store_ids = get_store_ids(dataset_options)
+    store_rows = _get_store_rows(prepared_data, store_ids, dataset_options.data_origin)
+    columns = list(prepared_data.columns.drop(["Date", "StoreID"]).drop(dataset_options.drop_columns))
+    store_columns = [f"Store_{store_id}" for store_id in store_ids] if len(store_ids) > 1 else []
 
-    data = data.drop(
-        labels=dataset_options.drop_columns,
-        axis="columns",
-    )
+    data = np.empty((len(store_ids), len(store_rows[0]), len(columns) + len(store_columns)), dtype=np.float32)
+    for column_index, column in enumerate(columns):
+        values = prepared_data[column].to_numpy()
+        for store_index, rows in enumerate(store_rows):
+            data[store_index, :, column_index] = values[rows]
+    if store_columns:
+        data[:, :, len(columns):] = np.eye(len(store_columns), dtype=np.float32)[:, np.newaxis, :]
 
-    train_df, val_df, test_df = _split_data(data)
+    split_rows = _get_split_rows(len(store_rows[0]))
+    normalizers = {}
+    for store_index, store_id in enumerate(store_ids):
+        features = data[store_index, :, :len(columns)]
+        normalizer = Normalizer.fit(features[:split_rows[0]], columns)
+        normalizer.transform(features)
+        normalizers[store_id] = Normalizer(
+            columns + store_columns,
+            np.concatenate([normalizer.mean, np.zeros(len(store_columns))]),
+            np.concatenate([normalizer.std, np.ones(len(store_columns))]),
+        )
 
-    train_df, normalization_params = normalize(train_df)
-    val_df, _ = normalize(val_df, normalization_params)
-    test_df, _ = normalize(test_df, normalization_params)
+    if len(store_ids) == 1:
+        data = data[0]
+        normalizers = {None: normalizers[store_ids[0]]}
+        store_ids = None
 
     return WindowGenerator(
         input_width=dataset_options.window_width,
         label_width=dataset_options.label_width,
         shift=dataset_options.shift,
         label_columns=dataset_options.label_columns,
-        train_df=train_df,
-        val_df=val_df,
-        test_df=test_df,
-        normalization_params=normalization_params,
-        time_stamps=time_stamps
+        data=data,
+        columns=columns + store_columns,
+        split_rows=split_rows,
+        normalizers=normalizers,
+        time_stamps=pd.to_datetime(prepared_data["Date"].to_numpy()[store_rows[0]]),
+        windowing=dataset_options.windowing,
+        store_ids=store_ids,
     )
 
 
-# import globally to save computation
-menu = pd.read_csv("./../Data/Sushi Menu.csv")
+MENU_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "..", "Data", "Sushi Menu.csv")
+
+
+class ProductCatalog:
+    """
+    Index over the sushi menu, keyed by the EAN of a product (the "Nummer" column of the menu,
+    e.g. 4260705920294). The menu is only read on first use.
+    """
+
+    def __init__(self, menu_path=MENU_PATH):
+        self.menu_path = menu_path
+        self._positions = None
+        self._duplicated = None
+        self._pieces = None
+        self._names = None
+        self._prices = None
+
+    def _load(self):
+        if self._positions is not None:
+            return
+        menu = pd.read_csv(self.menu_path)
+        p_ids = menu["Nummer"].astype(str)
+
+        self._duplicated = set(p_ids[p_ids.duplicated()])
+        self._positions = {p_id: i for i, p_id in enumerate(p_ids) if p_id not in self._duplicated}
+        self._pieces = menu["Count"].astype(int).to_numpy()
+        self._names = (menu["Type"] + " " + menu["main_ingredient"].fillna("")).str.strip().to_numpy()
+        self._prices = menu["Price_per_stuck"].astype(float).to_numpy()
+
+    def positions(self, p_ids: List[str]) -> np.ndarray:
+        """Rows of the products in the menu"""
+        self._load()
+        positions = []
+        for p_id in p_ids:
+            if p_id in self._duplicated:
+                raise AttributeError(f"Product number {p_id} found several times in menu (but has to be unique)")
+            if p_id not in self._positions:
+                raise AttributeError(f"Product number {p_id} not found in menu")
+            positions.append(self._positions[p_id])
+        return np.array(positions, dtype=int)
+
+    @property
+    def product_ids(self) -> List[str]:
+        self._load()
+        return list(self._positions.keys()) + list(self._duplicated)
+
+    def __contains__(self, p_id):
+        self._load()
+        return p_id in self._positions
+
+    def pieces(self, p_ids: List[str]) -> np.ndarray:
+        """Number of individual sushi pieces in each of the products"""
+        positions = self.positions(p_ids)
+        return self._pieces[positions]
+
+    def names(self, p_ids: List[str]) -> np.ndarray:
+        """Type and main ingredient of each of the products, e.g. "Maki Lachs" """
+        positions = self.positions(p_ids)
+        return self._names[positions]
+
+    def prices(self, p_ids: List[str]) -> np.ndarray:
+        """Price of one package of each of the products"""
+        positions = self.positions(p_ids)
+        return self._prices[positions]
+
+
+catalog = ProductCatalog()
 
 
 def get_all_product_ids():
-    global menu
-    return list(set(list(menu["Nummer"].astype(str))))
+    return catalog.product_ids
 
 
 def get_no_sushi_in_product(p_id: str):
@@ -119,12 +333,4 @@ def get_no_sushi_in_product(p_id: str):
     Gets the productId of a sushi menu item (e.g. 4260705920294) and returns the Number of individual
     sushi pieces are in this menu item.
     """
-    global menu
-
-    sushi_count = menu[menu['Nummer'].astype(str) == p_id]["Count"].astype(int).reset_index(drop=True)
-
-    if len(sushi_count) == 0:
-        raise AttributeError(f"Product number {p_id} not found in menu")
-    elif len(sushi_count) > 1:
-        raise AttributeError(f"Product number {p_id} found several times in menu (but has to be unique)")
-    return sushi_count[0]
+    return int(catalog.pieces([p_id])[0])
@@ -6,13 +6,21 @@ certain experiment.
 
 import os
 from abc import ABC, abstractmethod
+from dataclasses import asdict
 from typing import Any, Dict
 
-import matplotlib.pyplot as plt
+import pandas as pd
 
-from .analysis import create_results_table, save_history_plot, save_predictions_plot
-from .config import DatasetOptions, ALL_USED_PRODUCT_IDS
-from .data import get_window_dataset
+from .analysis import (
+    clear_prediction_cache,
+    create_results_table,
+    save_history_plot,
+    save_predictions_plot,
+)
+from .config import DatasetOptions, TrainingOptions, ALL_USED_PRODUCT_IDS
+from .data import get_dataset_hash, get_window_dataset
+from .model_store import ModelStore
+from .window_generator import WindowGenerator
 from .decorators import with_random_seed_reset
 from .performance import Performances
 
@@ -20,12 +28,39 @@ from .performance import Performances
 class Experiment(ABC):
     """Class that encapsulates one type of experiment with certain learning parameters"""
 
+    # whether `get_models` builds the models for the window width and features of the dataset options
+    # and passes `get_hyperparameters` to every model, only then `tune` can search them
+    tunable = False
+
     def __init__(self, name, path_to_output_folder):
         self.dataset_options = self.get_dataset_options()
-        self.data = get_window_dataset(self.dataset_options)
-        self.performance = Performances(self.data)
+        self.training_options = self.get_training_options()
+        # model name => keyword arguments that replace the defaults of the model, see `get_hyperparameters`
+        self.hyperparameters = {}
+        # model name => epochs used and time saved by the training policy
+        self.training_stats = {}
         self.name = name
         self.path_to_output_folder = path_to_output_folder
+        self.model_store = ModelStore(f"{path_to_output_folder}/models")
+        # (model name, load the stored model) of the model in _evaluate_single_model
+        self._fitting_model = None
+        # the windows `fit` trains on instead of `self.data`, see `fit_on_windows`
+        self._fitting_data = None
+        self._data = None
+        self._performance = None
+
+    @property
+    def data(self) -> WindowGenerator:
+        """The dataset is only loaded on first use"""
+        if self._data is None:
+            self._data = get_window_dataset(self.dataset_options)
+        return self._data
+
+    @property
+    def performance(self) -> Performances:
+        if self._performance is None:
+            self._performance = Performances(self.data)
+        return self._performance
 
     def __repr__(self):
         return f'Experiment {self.name}'
@@ -36,7 +71,72 @@ class Experiment(ABC):
 
     @abstractmethod
     def compile_and_fit(self, model):
-        """Return the history of the fit-function"""
+        """Compile the model and return the history of `self.fit(model)`"""
+
+    def get_training_options(self) -> TrainingOptions:
+        """Return the training policy of `fit`, override it to change the policy of an experiment"""
+        return TrainingOptions()
+
+    def fit(self, model):
+        """
+        Fits the compiled model with the training policy (early stopping, learning rate
+        reduction and restore of the best weights) and returns the history.
+        The trained model is saved in the model store, or loaded from it instead of training
+        when `_evaluate_single_model` was asked to use the stored model.
+        """
+        try:
+            return self._fit_or_load(model)
+        finally:
+            # the cached predictions of the model were made with its former weights
+            clear_prediction_cache(model)
+
+    def _fit_or_load(self, model):
+        from .training import fit
+
+        if self._fitting_data is not None:
+            history, self._last_training_stats = fit(model, self._fitting_data, self.training_options)
+            return history
+
+        if self._fitting_model is None:
+            history, self._last_training_stats = fit(model, self.data, self.training_options)
+            return history
+
+        model_name, use_stored_model = self._fitting_model
+        key = self._get_model_key(model_name)
+        if use_stored_model:
+            inputs, _ = next(iter(self.data.val))
+            stored = self.model_store.load(self.name, model_name, key, model, inputs)
+            if stored is not None:
+                print(" ... loaded the stored model")
+                history, self._last_training_stats = stored
+                return history
+
+        history, self._last_training_stats = fit(model, self.data, self.training_options)
+        self.model_store.save(self.name, model_name, key, model, history, self._last_training_stats,
+                              self.data.normalizers, self._get_settings_key(model_name))
+        return history
+
+    def _get_model_key(self, model_name):
+        return ModelStore.get_key(self.name, model_name, get_dataset_hash(self.dataset_options),
+                                  self._get_train_settings())
+
+    def _get_settings_key(self, model_name):
+        return ModelStore.get_settings_key(self.name, model_name, asdict(self.dataset_options),
+                                           self._get_train_settings())
+
+    def load_stored_model(self, model_name):
+        """
+        Builds the model with the weights of its latest stored training with the current dataset options and
+        training settings, without training. The model may be trained on older data, e.g. before new reports were
+        ingested, so it comes with the normalizers of its own training data.
+        Returns the model and its normalizers (store id => Normalizer), None if it is not stored.
+        """
+        model = self._get_model(model_name)
+        inputs, _ = next(iter(self.data.val))
+        key = self.model_store.load_latest(self.name, model_name, self._get_settings_key(model_name), model, inputs)
+        if key is None:
+            return None
+        return model, self.model_store.load_normalizers(self.name, model_name, key)
 
     @abstractmethod
     def get_train_settings(self) -> Dict[str, Any]:
@@ -48,12 +148,21 @@ class Experiment(ABC):
         - batch size
         - learning rate
         - training epochs
+
+        The settings of the training policy are added to them.
         """
 
     @abstractmethod
     def get_models(self) -> Dict[str, Any]:
         pass
 
+    def get_hyperparameters(self, model_name) -> Dict[str, Any]:
+        """
+        Hyperparameters of a model (e.g. units or dropout), that `get_models` passes to the model.
+        They are empty unless they are set, e.g. by the trials of `tune`.
+        """
+        return self.hyperparameters.get(model_name, {})
+
     def _get_model(self, model_name):
         models = self.get_models()
         if model_name not in models.keys():
@@ -61,22 +170,68 @@ class Experiment(ABC):
 
         return models[model_name]
 
+    def get_model_names(self):
+        return list(self.get_models().keys())
+
+    def _get_train_settings(self):
+        return {**self.get_train_settings(), **self.training_options.get_train_settings()}
+
     @with_random_seed_reset
-    def _evaluate_single_model(self, model_name, model, performance: Performances):
+    def _evaluate_single_model(self, model_name, performance: Performances, use_stored_model=False, benchmark=False):
+        """
+        Builds and fits the model after the seed reset, so the result does not depend
+        on what ran before (e.g. in another process).
+        use_stored_model => load the model from the model store if it was trained with the same data and settings
+        benchmark => run the full inference benchmark of `Performances.register_performance`
+        """
+        # rebuild the pipelines after the seed reset, so every model sees the same batch order
+        self.data.invalidate_cache(datasets_only=True)
+        model = self._get_model(model_name)
         print("Fit model: ", model_name)
-        history = self.compile_and_fit(model)
+        self._last_training_stats = {}
+        self._fitting_model = (model_name, use_stored_model)
+        try:
+            history = self.compile_and_fit(model)
+        finally:
+            self._fitting_model = None
+        self.training_stats[model_name] = self._last_training_stats
         print(" ... Done")
 
-        performance.register_performance(model_name, model)
+        performance.register_performance(model_name, model, benchmark)
         print("----------------------------------")
-        return history
+        return model, history
 
-    def run(self):
-        """Runs the experiment"""
-        models = self.get_models()
+    @with_random_seed_reset
+    def fit_on_windows(self, model_name, data, initial_weights=None):
+        """
+        Builds and fits the model on other windows than the splits of `self.data`, e.g. a backtesting fold,
+        and returns the model and its training statistics. The model store is not used.
+        data => has the `train` and `val` pipelines `fit` uses
+        initial_weights => weights of the same model the training starts from (warm start)
+        """
+        model = self._get_model(model_name)
+        if initial_weights is not None:
+            inputs, _ = next(iter(data.val))
+            model(inputs)
+            model.set_weights(initial_weights)
+
+        self._last_training_stats = {}
+        self._fitting_data = data
+        try:
+            self.compile_and_fit(model)
+        finally:
+            self._fitting_data = None
+        return model, self._last_training_stats
+
+    def run(self, benchmark=False):
+        """
+        Runs the experiment
+        benchmark => run the full inference benchmark for every model
+        """
         print(f"Run Experiment: {self.name}")
-        for name, model in models.items():
-            self._evaluate_single_model(name, model, self.performance)
+        models = {}
+        for name in self.get_model_names():
+            models[name], _ = self._evaluate_single_model(name, self.performance, benchmark=benchmark)
 
         self.save_information(models)
 
@@ -89,38 +244,72 @@ class Experiment(ABC):
             experiment_name=self.name,
             window_generator=self.data,
             data_origin=self.dataset_options.data_origin,
-            train_settings=self.get_train_settings(),
+            train_settings=self._get_train_settings(),
             models=models,
+            training_stats=self.training_stats,
         ).to_csv(f"{self.path_to_output_folder}/{self.name}_results.csv")
         print(" => Experiment Info Saved.")
 
-    def run_model(self, model_name: str, output_all_label_images=False):
-        """Runs a single model"""
-        model = self._get_model(model_name)
+    def save_merged_information(self, model_names):
+        """
+        Merges the outputs that `run_model` saved for each of the models into the
+        outputs of `run`, e.g. after the models were run in parallel.
+        """
+        performance = Performances(self.data)
+        results = []
+        for model_name in model_names:
+            file_location = self._get_model_output_folder(model_name)
+            performance.load(f"{file_location}/losses.csv")
+            results.append(
+                pd.read_csv(f"{file_location}/results.csv", header=[0, 1], index_col=0, float_precision="round_trip")
+            )
+
+        performance.save(f"{self.path_to_output_folder}/{self.name}_losses.csv")
+        performance.save_plot(f"{self.path_to_output_folder}/{self.name}_plot.jpg")
+        pd.concat(results, ignore_index=True).to_csv(f"{self.path_to_output_folder}/{self.name}_results.csv")
+        print(" => Experiment Info Saved.")
+
+    def _get_model_output_folder(self, model_name):
+        return f"{self.path_to_output_folder}/{self.name}/{model_name}"
+
+    def run_model(self, model_name: str, output_all_label_images=False, use_stored_model=False, benchmark=False,
+                  save_plots=True):
+        """
+        Runs a single model
+        use_stored_model => use the stored model instead of training it again, if there is one
+        benchmark => run the full inference benchmark
+        save_plots => save the history and predictions plots, otherwise only the losses and results
+                      that `save_merged_information` needs
+        """
+        import matplotlib.pyplot as plt
+
+        self._get_model(model_name)
         single_performance = Performances(self.data)
-        history = self._evaluate_single_model(model_name, model, single_performance)
+        model, history = self._evaluate_single_model(model_name, single_performance, use_stored_model, benchmark)
 
-        file_location = f"{self.path_to_output_folder}/{self.name}/{model_name}"
+        file_location = self._get_model_output_folder(model_name)
 
         if not os.path.exists(file_location):
             os.makedirs(file_location)
 
         single_performance.save(f"{file_location}/losses.csv")
-        save_history_plot(history, where=f"{file_location}/history.jpg")
-        if output_all_label_images:
-            save_predictions_plot(model, self.data, where=f"{file_location}/predictions.jpg",
-                                  columns=ALL_USED_PRODUCT_IDS)
-        else:
-            save_predictions_plot(model, self.data, where=f"{file_location}/predictions.jpg",
-                                  columns=self.data.label_columns)
+        if save_plots:
+            save_history_plot(history, where=f"{file_location}/history.jpg")
+            if output_all_label_images:
+                save_predictions_plot(model, self.data, where=f"{file_location}/predictions.jpg",
+                                      columns=ALL_USED_PRODUCT_IDS)
+            else:
+                save_predictions_plot(model, self.data, where=f"{file_location}/predictions.jpg",
+                                      columns=self.data.label_columns)
 
         create_results_table(
             performance=single_performance,
             experiment_name=self.name,
             window_generator=self.data,
             data_origin=self.dataset_options.data_origin,
-            train_settings=self.get_train_settings(),
+            train_settings=self._get_train_settings(),
             models={model_name: model},
+            training_stats=self.training_stats,
         ).to_csv(f"{file_location}/results.csv")
         print(" => Experiment Info Saved.")
         plt.clf()
@@ -0,0 +1,152 @@
+"""
+Stores the weights, the history, the training statistics and the normalization of trained models, so
+they don't have to be trained again e.g. to draw their predictions, and can be served with their exact scaling.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict, Optional, Tuple
+
+HISTORY_FILE = "history.json"
+NORMALIZER_FILE = "normalizer.json"
+WEIGHTS_PREFIX = "weights"
+
+
+class ModelStore:
+    """
+    <root>/<experiment>/<model>/<key>/ holds the stored model, where the key is made from the
+    experiment, the model, the dataset hash and the training settings. Only the latest key of a model is kept.
+    The settings key leaves out the content of the data, it finds the latest model of the same dataset options
+    and training settings after new data was added (see `load_latest`).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @staticmethod
+    def get_key(experiment_name: str, model_name: str, dataset_hash: str, train_settings: Dict[str, Any]) -> str:
+        description = json.dumps(
+            {
+                "experiment": experiment_name,
+                "model": model_name,
+                "dataset": dataset_hash,
+                "train_settings": train_settings,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(description.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def get_settings_key(experiment_name: str, model_name: str, dataset_options: Dict[str, Any],
+                         train_settings: Dict[str, Any]) -> str:
+        return ModelStore.get_key(experiment_name, model_name, json.dumps(dataset_options, sort_keys=True),
+                                  train_settings)
+
+    def _get_folder(self, experiment_name: str, model_name: str) -> str:
+        return os.path.join(self.root, experiment_name, model_name)
+
+    def save(self, experiment_name: str, model_name: str, key: str, model, history, training_stats: Dict[str, Any],
+             normalizers: Optional[Dict[Optional[int], Any]] = None, settings_key: Optional[str] = None):
+        """
+        normalizers => store id (None for one time series) => Normalizer of the data the model was trained on
+        settings_key => see `get_settings_key`
+        """
+        folder = self._get_folder(experiment_name, model_name)
+        # written under a temporary name first, so a failed or parallel run never leaves a half written model
+        temporary_folder = os.path.join(folder, f"{key}.{os.getpid()}.tmp")
+        os.makedirs(temporary_folder, exist_ok=True)
+
+        model.save_weights(os.path.join(temporary_folder, WEIGHTS_PREFIX))
+        with open(os.path.join(temporary_folder, HISTORY_FILE), "w") as file:
+            json.dump(
+                {
+                    "history": history.history,
+                    "epoch": history.epoch,
+                    "params": history.params,
+                    "training_stats": training_stats,
+                    "settings_key": settings_key,
+                },
+                file,
+                default=float,
+            )
+        if normalizers is not None:
+            with open(os.path.join(temporary_folder, NORMALIZER_FILE), "w") as file:
+                json.dump(
+                    [{"store_id": store_id, **normalizer.to_dict()} for store_id, normalizer in normalizers.items()],
+                    file,
+                )
+
+        # a model stored under the same key was trained on the same data and settings and is replaced
+        shutil.rmtree(os.path.join(folder, key), ignore_errors=True)
+        try:
+            os.replace(temporary_folder, os.path.join(folder, key))
+        except OSError:
+            # a parallel run stored the same key in the meantime
+            shutil.rmtree(temporary_folder, ignore_errors=True)
+
+        # the temporary folders belong to runs that are still writing
+        for outdated in os.listdir(folder):
+            if outdated != key and not outdated.endswith(".tmp"):
+                shutil.rmtree(os.path.join(folder, outdated), ignore_errors=True)
+
+    def load(self, experiment_name: str, model_name: str, key: str, model, inputs) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """
+        Loads the stored weights into the model and returns the history and the training statistics,
+        None if there is no model stored under the key.
+        inputs => a batch the model is built with before the weights are loaded
+        """
+        import tensorflow as tf
+
+        folder = os.path.join(self._get_folder(experiment_name, model_name), key)
+        if not os.path.exists(os.path.join(folder, HISTORY_FILE)):
+            return None
+
+        model(inputs)
+        model.load_weights(os.path.join(folder, WEIGHTS_PREFIX)).expect_partial()
+
+        with open(os.path.join(folder, HISTORY_FILE)) as file:
+            stored = json.load(file)
+        history = tf.keras.callbacks.History()
+        history.history = stored["history"]
+        history.epoch = stored["epoch"]
+        history.params = stored["params"]
+        history.set_model(model)
+        return history, stored["training_stats"]
+
+    def load_latest(self, experiment_name: str, model_name: str, settings_key: str, model, inputs) -> Optional[str]:
+        """
+        Loads the weights of the latest stored model with the settings key into the model, also if it was trained
+        on older data, and returns its key. None if there is no such model.
+        inputs => a batch the model is built with before the weights are loaded
+        """
+        folder = self._get_folder(experiment_name, model_name)
+        if not os.path.isdir(folder):
+            return None
+        candidates = []
+        for key in os.listdir(folder):
+            path = os.path.join(folder, key, HISTORY_FILE)
+            if key.endswith(".tmp") or not os.path.exists(path):
+                continue
+            with open(path) as file:
+                if json.load(file).get("settings_key") == settings_key:
+                    candidates.append((os.path.getmtime(path), key))
+        if not candidates:
+            return None
+
+        _, key = max(candidates)
+        model(inputs)
+        model.load_weights(os.path.join(folder, key, WEIGHTS_PREFIX)).expect_partial()
+        return key
+
+    def load_normalizers(self, experiment_name: str, model_name: str, key: str) -> Optional[Dict[Optional[int], Any]]:
+        """store id => Normalizer of the stored model, None if there is none"""
+        from .config import Normalizer
+
+        path = os.path.join(self._get_folder(experiment_name, model_name), key, NORMALIZER_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            return {values.pop("store_id"): Normalizer.from_dict(values) for values in json.load(file)}
@@ -4,13 +4,25 @@ A helper class that tracks performances for experiments.
 
 import time
 from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import tensorflow as tf
 
-from .data import WindowGenerator
+if TYPE_CHECKING:
+    from .window_generator import WindowGenerator
+
+# batch sizes of the throughput measurements of the full benchmark
+BENCHMARK_BATCH_SIZES = [1, 32, 256, 4096]
+# batch size of the only measurement without the full benchmark
+DEFAULT_BENCHMARK_BATCH_SIZE = 256
+LATENCY_PERCENTILES = [50, 95, 99]
+# calls before measuring (tracing, allocations, ...), single-window requests that are measured
+WARMUP_CALLS = 10
+LATENCY_CALLS = 200
+# every throughput measurement runs at least that many calls and seconds
+THROUGHPUT_CALLS = 3
+THROUGHPUT_SECONDS = 0.2
 
 
 @dataclass
@@ -23,18 +35,18 @@ class TrackedPerformances:
 
 
 class Performances:
-    def __init__(self, window_generator: WindowGenerator):
+    def __init__(self, window_generator: "WindowGenerator"):
         self.window_generator = window_generator
 
         self.performances = TrackedPerformances()
 
         self.model_names = []
 
-    def register_performance(self, name, model):
+    def register_performance(self, name, model, benchmark=False):
+        """benchmark => run the full inference benchmark, see `benchmark_inference`"""
         self.model_names.append(name)
 
         print("  ... measuring performance ...")
-        before = time.process_time()
         self.performances.train[name] = model.evaluate(
             self.window_generator.train, verbose=0
         )
@@ -44,11 +56,9 @@ class Performances:
         self.performances.test[name] = model.evaluate(
             self.window_generator.test, verbose=0
         )
-        after = time.process_time()
 
-        self.performances.timing[name] = (
-                (after - before) * 1000 / self.window_generator.total_samples
-        )
+        print("  ... measuring inference timing ...")
+        self.performances.timing[name] = benchmark_inference(model, self.window_generator, full=benchmark)
 
         self.performances.metrics_names[name] = model.metrics_names
 
@@ -87,7 +97,20 @@ class Performances:
         self.create_performance_data().to_csv(where)
         print(" => Statistics Saved.")
 
+    def load(self, where):
+        """Registers the performances of all models in a file written by `save` (without timings)."""
+        stats = pd.read_csv(where, header=[0, 1], index_col=0, float_precision="round_trip")
+        metrics_names = list(dict.fromkeys(stats.columns.get_level_values(0)))
+        for name, row in stats.iterrows():
+            self.model_names.append(name)
+            self.performances.metrics_names[name] = metrics_names
+            self.performances.train[name] = [row[(loss, "Training")] for loss in metrics_names]
+            self.performances.valid[name] = [row[(loss, "Validation")] for loss in metrics_names]
+            self.performances.test[name] = [row[(loss, "Test")] for loss in metrics_names]
+
     def save_plot(self, where):
+        import matplotlib.pyplot as plt
+
         loss_name = "loss"
 
         x_pos = np.arange(len(self.model_names))
@@ -122,19 +145,76 @@ class Performances:
         print(" => Performance Plot Saved.")
         plt.clf()
 
-    def get_timing(self, model_name):
+    def get_timing(self, model_name) -> Dict[str, float]:
         return self.performances.timing[model_name]
 
 
+def benchmark_inference(model, window_generator: "WindowGenerator", full=False) -> Dict[str, float]:
+    """
+    Wall-clock inference timing on the windows of the dataset, without losses and tf.data pipelines.
+    With `full`:
+    - latency of single-window requests (percentiles in ms)
+    - throughput for every batch size of BENCHMARK_BATCH_SIZES (windows/s)
+    each when calling the model eagerly (`model(x)`) and compiled as tf.function (traced during the warmup,
+    `model.predict_on_batch` would add the setup of a data adapter to every call).
+    Otherwise only the compiled throughput for DEFAULT_BENCHMARK_BATCH_SIZE, which takes a fraction of a second.
+
+    Returns column name => value, e.g. "Latency p95 compiled (ms)" => 0.8
+    """
+    import tensorflow as tf
+
+    windows = window_generator.get_all_inputs_sequentially()
+    modes = {
+        "eager": lambda x: model(x, training=False),
+        "compiled": tf.function(lambda x: model(x, training=False)),
+    }
+    if not full:
+        modes.pop("eager")
+
+    timing = {}
+    # the latency is only measured by the full benchmark
+    for mode, predict in (modes if full else {}).items():
+        requests = [tf.constant(windows[i % len(windows)][np.newaxis]) for i in range(LATENCY_CALLS)]
+        for request in requests[:WARMUP_CALLS]:
+            predict(request)
+        latencies = []
+        for request in requests:
+            before = time.perf_counter()
+            predict(request)
+            latencies.append(time.perf_counter() - before)
+        for percentile, latency in zip(LATENCY_PERCENTILES, np.percentile(latencies, LATENCY_PERCENTILES)):
+            timing[f"Latency p{percentile} {mode} (ms)"] = latency * 1000
+
+    for mode, predict in modes.items():
+        for batch_size in BENCHMARK_BATCH_SIZES if full else [DEFAULT_BENCHMARK_BATCH_SIZE]:
+            # the windows are repeated for batches larger than the dataset
+            batch = tf.constant(np.resize(windows, (batch_size,) + windows.shape[1:]))
+            predict(batch)
+            calls = 0
+            before = time.perf_counter()
+            while calls < THROUGHPUT_CALLS or time.perf_counter() - before < THROUGHPUT_SECONDS:
+                predict(batch)
+                calls += 1
+            timing[f"Throughput batch {batch_size} {mode} (windows/s)"] = (
+                    calls * batch_size / (time.perf_counter() - before)
+            )
+
+    return timing
+
+
 def get_model_size_byte(model):
     return _get_model_memory_usage(model)
 
 
 def get_trainable_params(model):
+    import tensorflow as tf
+
     return np.sum([tf.size(w_matrix).numpy() for w_matrix in model.trainable_variables])
 
 
 def get_non_trainable_params(model):
+    import tensorflow as tf
+
     return np.sum(
         [tf.size(w_matrix).numpy() for w_matrix in model.non_trainable_variables]
     )
@@ -145,6 +225,7 @@ def _get_model_memory_usage(model):
     Copyright: From comment on stack-overflow:
     https://stackoverflow.com/questions/43137288/how-to-determine-needed-memory-of-keras-model
     """
+    import tensorflow as tf
 
     shapes_mem_count = 0
     internal_model_mem_count = 0
@@ -153,7 +234,11 @@ def _get_model_memory_usage(model):
         if layer_type == "Model":
             internal_model_mem_count += _get_model_memory_usage(layer)
         single_layer_mem = 1
-        out_shape = layer.output_shape
+        try:
+            out_shape = layer.output_shape
+        except AttributeError:
+            # e.g. the LSTMCell of FeedBack, that is only called inside of the RNN and the decoding loop
+            continue
         if type(out_shape) is list:
             out_shape = out_shape[0]
         for s in out_shape:
@@ -0,0 +1,87 @@
+"""
+Runs the models of experiments in parallel worker processes.
+Every worker has its own TensorFlow runtime with a fixed number of threads.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+# experiments that were already set up in the worker process: (class, name, output folder) => experiment
+_worker_experiments = {}
+
+
+def _init_worker(threads):
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+
+def make_pool(jobs: int) -> ProcessPoolExecutor:
+    """A pool of `jobs` worker processes, that share the CPU cores for their TensorFlow threads"""
+    return ProcessPoolExecutor(
+        max_workers=jobs,
+        # TensorFlow is not fork-safe
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(max(1, (os.cpu_count() or 1) // jobs),),
+    )
+
+
+def get_experiment_spec(experiment) -> Tuple[type, str, str]:
+    """What a worker process needs to set up the experiment: (class, name, output folder)"""
+    return type(experiment), experiment.name, experiment.path_to_output_folder
+
+
+def get_worker_experiment(experiment_spec):
+    """The experiment of the spec, which is only set up once in every worker process"""
+    if experiment_spec not in _worker_experiments:
+        experiment_class, name, path_to_output_folder = experiment_spec
+        _worker_experiments[experiment_spec] = experiment_class(name, path_to_output_folder)
+    return _worker_experiments[experiment_spec]
+
+
+def _run_model_in_worker(experiment_spec, model_name, output_all_label_images, use_stored_models, benchmark,
+                         save_plots):
+    get_worker_experiment(experiment_spec).run_model(
+        model_name, output_all_label_images=output_all_label_images, use_stored_model=use_stored_models,
+        benchmark=benchmark, save_plots=save_plots,
+    )
+
+
+def run_in_parallel(experiments: List, jobs: int, output_all_label_images=False, save_merged=True,
+                    use_stored_models=False, benchmark=False, save_plots=False):
+    """
+    Runs every (experiment, model) pair with `Experiment.run_model` on a pool of `jobs` processes.
+    With `save_merged` the outputs of each experiment are merged afterwards as if `Experiment.run` was used.
+    Like `Experiment.run`, the per-model history and predictions plots are only saved with `save_plots`;
+    the per-model losses.csv and results.csv are always written, they are the input of the merge.
+    """
+    tasks = [
+        (experiment, model_name)
+        for experiment in experiments
+        for model_name in experiment.get_model_names()
+    ]
+
+    with make_pool(jobs) as executor:
+        futures = [
+            executor.submit(
+                _run_model_in_worker,
+                get_experiment_spec(experiment),
+                model_name,
+                output_all_label_images,
+                use_stored_models,
+                benchmark,
+                save_plots,
+            )
+            for experiment, model_name in tasks
+        ]
+        for future in futures:
+            # raises the exception of a failed worker
+            future.result()
+
+    if save_merged:
+        for experiment in experiments:
+            experiment.save_merged_information(experiment.get_model_names())
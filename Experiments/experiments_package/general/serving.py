@@ -0,0 +1,297 @@
+"""
+A local HTTP forecast service for stored models (asyncio, no web framework).
+
+The models are loaded once from the model store with their normalizers and kept warm. A request sends the
+features of the last `input_width` days of a store; the forecast is denormalized, rounded to whole sets and
+converted to sushi pieces via the menu. The requests of a model that arrive together are predicted in
+micro-batches: one `model(x)` call for up to `max_batch_size` requests. The model runs in a thread, so the requests
+that arrive meanwhile make up the next batch; under load (the last batch had more than one request) a batch also
+waits at most `max_delay_ms` for more requests after the first one, a single client is not delayed.
+
+    GET  /models                         served models, their input columns, input width and stores
+    GET  /stats                          requests, batches and average batch size per model
+    POST /forecast/<experiment>/<model>  {"store_id": 4051653300272, "days": [{"<column>": value, ...}, ...]}
+"""
+
+import asyncio
+import json
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+import numpy as np
+
+from .analysis import get_predicted_products
+from .data import catalog
+
+if TYPE_CHECKING:
+    from .experiment import Experiment
+
+MAX_BODY_SIZE = 1 << 20
+
+
+class RequestError(Exception):
+    """A request that can't be answered, with the HTTP status of the response"""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class WarmModel:
+    """A stored model with its normalizers, that predicts the queued requests in micro-batches"""
+
+    def __init__(self, experiment: "Experiment", model_name: str, max_batch_size=64, max_delay_ms=2.0):
+        import tensorflow as tf
+
+        loaded = experiment.load_stored_model(model_name)
+        if loaded is None:
+            raise ValueError(
+                f"No stored model {model_name} of {experiment.name} for the current dataset options and settings, "
+                "train it first (e.g. with run)"
+            )
+        self.model, self.normalizers = loaded
+        self.experiment_name = experiment.name
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000
+
+        window_generator = experiment.data
+        self.input_width = window_generator.input_width
+        self.columns = window_generator.columns
+        self.store_ids = window_generator.store_ids
+        self.store_columns = [f"Store_{store_id}" for store_id in self.store_ids or []]
+        self.feature_columns = [column for column in self.columns if column not in self.store_columns]
+        self.product_ids, self.label_positions = get_predicted_products(window_generator)
+        self.pieces = catalog.pieces(self.product_ids)
+        self.names = catalog.names(self.product_ids)
+        # label index => days after the last input day
+        self.days_ahead = [int(index) - self.input_width + 1 for index in window_generator.label_indices]
+
+        # one trace for all batch sizes
+        self._predict = tf.function(
+            lambda inputs: self.model(inputs, training=False),
+            input_signature=[tf.TensorSpec((None, self.input_width, len(self.columns)), tf.float32)],
+        )
+        self._predict(np.zeros((1, self.input_width, len(self.columns)), dtype=np.float32))
+
+        self.requests = 0
+        self.batches = 0
+        self._queue = None
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "experiment": self.experiment_name,
+            "model": self.model_name,
+            "input_width": self.input_width,
+            "columns": self.feature_columns,
+            "store_ids": self.store_ids,
+            "products": self.product_ids,
+        }
+
+    def _get_normalizer(self, store_id: Optional[int]):
+        if self.store_ids is None:
+            # a model of one time series is normalized with the statistics of its store for every store
+            return self.normalizers[None]
+        if store_id not in self.store_ids:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"store_id has to be one of {self.store_ids}")
+        return self.normalizers[store_id]
+
+    def make_inputs(self, store_id: Optional[int], days: List[Dict[str, float]]) -> np.ndarray:
+        """The normalized window (input_width, columns) of the last `input_width` days"""
+        if not isinstance(days, list) or len(days) < self.input_width:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"days has to be a list of at least {self.input_width} days")
+        days = days[-self.input_width:]
+        if not all(isinstance(day, dict) for day in days):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "every day has to be a JSON object of column => value")
+        missing = sorted({column for day in days for column in self.feature_columns if column not in day})
+        if missing:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"missing columns: {missing}")
+
+        inputs = np.zeros((self.input_width, len(self.columns)), dtype=np.float32)
+        try:
+            inputs[:, :len(self.feature_columns)] = [[day[column] for column in self.feature_columns] for day in days]
+        except (TypeError, ValueError) as error:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"invalid feature values: {error!r}")
+        self._get_normalizer(store_id).transform(inputs[:, :len(self.feature_columns)], self.feature_columns)
+        if self.store_ids is not None:
+            # the store features have mean 0 and standard deviation 1
+            inputs[:, len(self.feature_columns) + self.store_ids.index(store_id)] = 1
+        return inputs
+
+    def make_forecast(self, store_id: Optional[int], outputs: np.ndarray) -> Dict[str, Any]:
+        """Denormalized outputs (label_width, labels) of a request as whole sets and sushi pieces per product"""
+        forecasts = self._get_normalizer(store_id).inverse_transform(outputs[:, self.label_positions], self.product_ids)
+        # we cannot produce half or negative sets
+        sets = np.maximum(np.rint(forecasts), 0).astype(int)
+        return {
+            "experiment": self.experiment_name,
+            "model": self.model_name,
+            "store_id": store_id,
+            "forecasts": [
+                {
+                    "days_ahead": days_ahead,
+                    "products": [
+                        {
+                            "product_id": product_id,
+                            "name": name,
+                            "forecast": float(forecast),
+                            "sets": int(product_sets),
+                            "pieces": int(product_sets * pieces),
+                        }
+                        for product_id, name, forecast, product_sets, pieces in zip(
+                            self.product_ids, self.names, day_forecasts, day_sets, self.pieces
+                        )
+                    ],
+                }
+                for days_ahead, day_forecasts, day_sets in zip(self.days_ahead, forecasts, sets)
+            ],
+        }
+
+    async def forecast(self, store_id: Optional[int], days: List[Dict[str, float]]) -> Dict[str, Any]:
+        inputs = self.make_inputs(store_id, days)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((inputs, future))
+        return self.make_forecast(store_id, await future)
+
+    async def run_batches(self):
+        """Predicts the queued requests in batches, until it is cancelled"""
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        batch_size = 1
+        while True:
+            requests = [await self._queue.get()]
+            deadline = loop.time() + (self.max_delay if batch_size > 1 else 0)
+            while len(requests) < self.max_batch_size:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        requests.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    requests.append(self._queue.get_nowait())
+
+            try:
+                outputs = await loop.run_in_executor(
+                    None, lambda: self._predict(np.stack([inputs for inputs, _ in requests])).numpy()
+                )
+            except Exception as error:
+                for _, future in requests:
+                    if not future.cancelled():
+                        future.set_exception(error)
+                continue
+            batch_size = len(requests)
+            self.requests += batch_size
+            self.batches += 1
+            for (_, future), output in zip(requests, outputs):
+                if not future.cancelled():
+                    future.set_result(output)
+
+
+class ForecastService:
+    """Routes the HTTP requests to the warm models"""
+
+    def __init__(self, models: List[WarmModel]):
+        self.models = {(model.experiment_name, model.model_name): model for model in models}
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "experiment": model.experiment_name,
+                "model": model.model_name,
+                "requests": model.requests,
+                "batches": model.batches,
+                "average_batch_size": model.requests / model.batches if model.batches else 0,
+            }
+            for model in self.models.values()
+        ]
+
+    async def handle(self, method: str, path: str, body: bytes) -> Tuple[HTTPStatus, Any]:
+        parts = [unquote(part) for part in path.split("?")[0].strip("/").split("/")]
+        if method == "GET" and parts == ["models"]:
+            return HTTPStatus.OK, [model.describe() for model in self.models.values()]
+        if method == "GET" and parts == ["stats"]:
+            return HTTPStatus.OK, self.get_stats()
+        if method == "POST" and len(parts) == 3 and parts[0] == "forecast":
+            model = self.models.get((parts[1], parts[2]))
+            if model is None:
+                raise RequestError(HTTPStatus.NOT_FOUND, f"model {parts[2]} of {parts[1]} is not served")
+            try:
+                request = json.loads(body)
+            except ValueError as error:
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"invalid JSON: {error}")
+            if not isinstance(request, dict):
+                raise RequestError(HTTPStatus.BAD_REQUEST, "the request has to be a JSON object")
+            return HTTPStatus.OK, await model.forecast(request.get("store_id"), request.get("days"))
+        raise RequestError(HTTPStatus.NOT_FOUND, f"{method} {path} not found")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answers the HTTP/1.1 requests of a connection, which is kept alive unless the client closes it"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                if length > MAX_BODY_SIZE:
+                    status, result = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "request too large"}
+                    # the body is not read, so the connection can't be used for another request
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length)
+                    try:
+                        status, result = await self.handle(method, path, body)
+                    except RequestError as error:
+                        status, result = error.status, {"error": str(error)}
+                    except Exception as error:
+                        status, result = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": repr(error)}
+
+                payload = json.dumps(result).encode()
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            # a malformed request or a client that went away
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        batchers = [asyncio.create_task(model.run_batches()) for model in self.models.values()]
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving {[f'{e}/{m}' for e, m in self.models]} on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for batcher in batchers:
+                batcher.cancel()
+
+
+def serve(models: List[Tuple["Experiment", str]], host="127.0.0.1", port=8000, max_batch_size=64, max_delay_ms=2.0):
+    """Loads the stored models of the (experiment, model name) pairs and serves them until interrupted"""
+    service = ForecastService(
+        [WarmModel(experiment, model_name, max_batch_size, max_delay_ms) for experiment, model_name in models]
+    )
+    try:
+        asyncio.run(service.serve(host, port))
+    except KeyboardInterrupt:
+        pass
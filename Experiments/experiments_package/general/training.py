@@ -0,0 +1,102 @@
+"""
+Fits the models with the training policy of TrainingOptions.
+"""
+
+import time
+from typing import TYPE_CHECKING, Any, Dict, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from .config import TrainingOptions
+
+if TYPE_CHECKING:
+    from .window_generator import WindowGenerator
+
+
+class RestoreBestWeights(tf.keras.callbacks.Callback):
+    """
+    Keeps the weights of the best epoch in memory and restores them when the training ends.
+    (EarlyStopping only restores them when it stops the training itself.)
+    """
+
+    def __init__(self, monitor: str):
+        super().__init__()
+        self.monitor = monitor
+        self.best = None
+        self.best_weights = None
+
+    def on_train_begin(self, logs=None):
+        self.best = None
+        self.best_weights = None
+
+    def on_epoch_end(self, epoch, logs=None):
+        current = (logs or {}).get(self.monitor)
+        if current is not None and (self.best is None or current < self.best):
+            self.best = current
+            self.best_weights = self.model.get_weights()
+
+    def on_train_end(self, logs=None):
+        if self.best_weights is not None:
+            self.model.set_weights(self.best_weights)
+
+
+class EpochTimes(tf.keras.callbacks.Callback):
+    """Measures the wall-clock time of every epoch"""
+
+    def __init__(self):
+        super().__init__()
+        self.times = []
+        self._begin = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._begin = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.times.append(time.perf_counter() - self._begin)
+
+    def average_epoch_time(self):
+        # the first epoch also traces the graphs, so it only counts when there is no other one
+        return float(np.mean(self.times[1:] or self.times))
+
+
+def get_callbacks(options: TrainingOptions):
+    callbacks = []
+    if options.early_stopping_patience is not None:
+        callbacks.append(
+            tf.keras.callbacks.EarlyStopping(monitor=options.monitor, patience=options.early_stopping_patience)
+        )
+    if options.reduce_lr_patience is not None:
+        callbacks.append(
+            tf.keras.callbacks.ReduceLROnPlateau(
+                monitor=options.monitor,
+                factor=options.reduce_lr_factor,
+                patience=options.reduce_lr_patience,
+                min_lr=options.min_learning_rate,
+            )
+        )
+    if options.restore_best_weights:
+        callbacks.append(RestoreBestWeights(options.monitor))
+    return callbacks
+
+
+def fit(model, data: "WindowGenerator", options: TrainingOptions) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Fits the compiled model and returns the history and the training statistics:
+    the epochs that were used and the time that was saved compared to training all max_epochs
+    (estimated with the average time of the used epochs).
+    """
+    epoch_times = EpochTimes()
+    history = model.fit(
+        data.train,
+        epochs=options.max_epochs,
+        validation_data=data.val,
+        callbacks=get_callbacks(options) + [epoch_times],
+        verbose=0,
+    )
+
+    epochs_used = len(history.epoch)
+    return history, {
+        "Epochs Used": epochs_used,
+        "Time Saved (s)": epoch_times.average_epoch_time() * (options.max_epochs - epochs_used),
+    }
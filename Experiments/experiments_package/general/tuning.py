@@ -0,0 +1,260 @@
+"""
+Hyperparameter search for a model of an experiment with asynchronous successive halving (ASHA).
+
+A search space maps dataset options (TUNABLE_DATASET_OPTIONS) and keyword arguments of the model
+(see Experiment.get_hyperparameters) to the values that are tried, every combination is one trial.
+All trials are trained for `min_epochs` first (rung 0). A trial moves up to the next rung, where it trains on
+from its weights until `reduction_factor` times as many epochs, as soon as its validation loss is in the best
+1 / reduction_factor of the trials that finished its rung, so the workers never wait for a whole rung.
+The last rung trains until `max_epochs`.
+
+The windowed datasets are cached per dataset options in every process, trials that only differ in
+the model share them.
+"""
+
+import copy
+import dataclasses
+import itertools
+import json
+import random
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .runner import get_experiment_spec, get_worker_experiment, make_pool
+
+if TYPE_CHECKING:
+    from .experiment import Experiment
+    from .window_generator import WindowGenerator
+
+# the dataset options a search space may change, drop_columns are dropped in addition to those of the experiment
+TUNABLE_DATASET_OPTIONS = ["window_width", "drop_columns"]
+# metric of model.evaluate => column prefix of the results, as in optimization/*.csv
+METRICS = {"loss": "MSE", "mean_absolute_error": "MAE"}
+SPLITS = {"train": "Training", "val": "Validation", "test": "Test"}
+
+
+@dataclass
+class Trial:
+    """One combination of the search space"""
+
+    number: int
+    dataset_options: Dict[str, Any]
+    hyperparameters: Dict[str, Any]
+
+    def get_name(self, model_name: str) -> str:
+        parameters = {**self.dataset_options, **self.hyperparameters}
+        return " ".join([model_name] + [f"{name}={value}" for name, value in parameters.items()])
+
+
+def make_trials(search_space: Dict[str, List[Any]], trials: Optional[int] = None, seed=0) -> List[Trial]:
+    """
+    Every combination of the values of the search space, or `trials` randomly chosen combinations.
+    search_space => dataset option or hyperparameter => values
+    """
+    for name, values in search_space.items():
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"The search space needs a non-empty list of values for {name}, not {values}")
+
+    names = list(search_space.keys())
+    combinations = list(itertools.product(*search_space.values()))
+    if trials is not None and trials < len(combinations):
+        combinations = random.Random(seed).sample(combinations, trials)
+
+    result = []
+    for number, values in enumerate(combinations):
+        parameters = dict(zip(names, values))
+        result.append(
+            Trial(
+                number,
+                {name: value for name, value in parameters.items() if name in TUNABLE_DATASET_OPTIONS},
+                {name: value for name, value in parameters.items() if name not in TUNABLE_DATASET_OPTIONS},
+            )
+        )
+    return result
+
+
+def load_search_space(path: str) -> Dict[str, List[Any]]:
+    """The search space of a JSON file, e.g. {"window_width": [3, 7], "units": [32, 64], "dropout": [0.2, 0.8]}"""
+    with open(path) as file:
+        return json.load(file)
+
+
+def get_rung_epochs(min_epochs: int, max_epochs: int, reduction_factor: int) -> List[int]:
+    """The epochs a trial has trained after each rung"""
+    if min_epochs < 1 or max_epochs < min_epochs or reduction_factor < 2:
+        raise ValueError(
+            f"Invalid rungs: min_epochs {min_epochs}, max_epochs {max_epochs}, reduction_factor {reduction_factor}"
+        )
+    epochs = [min_epochs]
+    while epochs[-1] * reduction_factor < max_epochs:
+        epochs.append(epochs[-1] * reduction_factor)
+    if epochs[-1] < max_epochs:
+        epochs.append(max_epochs)
+    return epochs
+
+
+class SuccessiveHalving:
+    """
+    Decides which trial trains on which rung next (ASHA): a trial is promoted as soon as it is in the best
+    1 / reduction_factor of the trials that finished its rung, new trials only start when none can be promoted.
+    """
+
+    def __init__(self, trial_count: int, rung_count: int, reduction_factor: int):
+        self.reduction_factor = reduction_factor
+        self._waiting = list(range(trial_count))
+        # rung => trial => validation loss
+        self.losses: List[Dict[int, float]] = [{} for _ in range(rung_count)]
+        self._promoted = [set() for _ in range(rung_count)]
+
+    def next_job(self) -> Optional[Tuple[int, int]]:
+        """(trial, rung) to train next, None if there is nothing to do until another job finished"""
+        for rung in reversed(range(len(self.losses) - 1)):
+            finished = sorted(self.losses[rung], key=self.losses[rung].get)
+            for trial in finished[:len(finished) // self.reduction_factor]:
+                if trial not in self._promoted[rung]:
+                    self._promoted[rung].add(trial)
+                    return trial, rung + 1
+        if self._waiting:
+            return self._waiting.pop(0), 0
+        return None
+
+    def report(self, trial: int, rung: int, loss: float):
+        self.losses[rung][trial] = loss
+
+
+# dataset options (as JSON) => window generator, shared by the trials of one process
+_window_datasets = {}
+
+
+def _get_window_dataset(options) -> "WindowGenerator":
+    from .data import get_window_dataset
+
+    key = json.dumps(dataclasses.asdict(options), sort_keys=True)
+    if key not in _window_datasets:
+        _window_datasets[key] = get_window_dataset(options)
+    return _window_datasets[key]
+
+
+def _get_trial_experiment(experiment: "Experiment", model_name: str, trial: Trial, epochs: int) -> "Experiment":
+    """A copy of the experiment with the dataset options, hyperparameters and epochs of the trial"""
+    options = dict(trial.dataset_options)
+    if "drop_columns" in options:
+        options["drop_columns"] = experiment.dataset_options.drop_columns + list(options["drop_columns"])
+
+    trial_experiment = copy.copy(experiment)
+    trial_experiment.dataset_options = dataclasses.replace(experiment.dataset_options, **options)
+    trial_experiment.training_options = dataclasses.replace(experiment.training_options, max_epochs=epochs)
+    trial_experiment.hyperparameters = {**experiment.hyperparameters, model_name: trial.hyperparameters}
+    trial_experiment.training_stats = {}
+    trial_experiment._data = _get_window_dataset(trial_experiment.dataset_options)
+    trial_experiment._performance = None
+    return trial_experiment
+
+
+def _check_search_space(experiment: "Experiment", model_name: str, trials: List[Trial]):
+    """Raises a ValueError before any training if the trials can't change the model of the experiment"""
+    if not experiment.tunable:
+        raise ValueError(
+            f"{experiment.name} builds its models with fixed inputs and hyperparameters, "
+            "so the dataset options and hyperparameters of a search space have no effect on them"
+        )
+    # all trials have the same hyperparameter names, the models are built without training
+    trial_experiment = _get_trial_experiment(experiment, model_name, trials[0], experiment.training_options.max_epochs)
+    try:
+        trial_experiment.get_models()
+    except TypeError as error:
+        raise ValueError(
+            f"{list(trials[0].hyperparameters)} are not all keyword arguments of {model_name} "
+            f"of {experiment.name}: {error}"
+        ) from error
+
+
+def _run_trial(experiment: "Experiment", model_name: str, trial: Trial, epochs: int, initial_weights=None):
+    """
+    Trains the trial for `epochs` (more) epochs and returns its weights, the metrics of all splits
+    and the epochs that were used
+    """
+    trial_experiment = _get_trial_experiment(experiment, model_name, trial, epochs)
+    data = trial_experiment.data
+    # the pipelines are rebuilt after the seed reset of fit_on_windows, so every trial sees the same batches
+    data.invalidate_cache(datasets_only=True)
+    model, training_stats = trial_experiment.fit_on_windows(model_name, data, initial_weights)
+
+    metrics = {}
+    for split, split_name in SPLITS.items():
+        values = model.evaluate(getattr(data, split), verbose=0)
+        for metric, value in zip(model.metrics_names, values):
+            if metric in METRICS:
+                metrics[f"{METRICS[metric]}_{split_name}"] = value
+    return model.get_weights(), metrics, training_stats.get("Epochs Used", epochs)
+
+
+def _run_trial_in_worker(experiment_spec, model_name, trial, epochs, initial_weights):
+    return _run_trial(get_worker_experiment(experiment_spec), model_name, trial, epochs, initial_weights)
+
+
+def tune(experiment: "Experiment", model_name: str, search_space: Dict[str, List[Any]], min_epochs=3,
+         max_epochs: Optional[int] = None, reduction_factor=3, trials: Optional[int] = None, jobs=1) -> pd.DataFrame:
+    """
+    Searches the hyperparameters of the model with ASHA and returns the MSE and MAE of the training,
+    validation and test windows of every trial after its last rung, indexed by the trial name like
+    optimization/*.csv. The trials that got furthest come first, then by validation MSE.
+    max_epochs => epochs of the last rung, by default those of the training options of the experiment
+    trials => number of randomly chosen combinations of the search space, by default all of them
+    jobs => processes that train the trials in parallel
+    """
+    trial_list = make_trials(search_space, trials)
+    _check_search_space(experiment, model_name, trial_list)
+    rung_epochs = get_rung_epochs(min_epochs, max_epochs or experiment.training_options.max_epochs, reduction_factor)
+    scheduler = SuccessiveHalving(len(trial_list), len(rung_epochs), reduction_factor)
+    # trial => weights, metrics, rung and epochs used after its last finished job
+    weights, results = {}, {}
+
+    def get_epochs(rung):
+        return rung_epochs[rung] - (rung_epochs[rung - 1] if rung > 0 else 0)
+
+    def report(trial, rung, result):
+        weights[trial], metrics, epochs_used = result
+        previous_epochs = results[trial]["Epochs Used"] if trial in results else 0
+        results[trial] = {**metrics, "Rung": rung, "Epochs Used": previous_epochs + epochs_used}
+        scheduler.report(trial, rung, metrics["MSE_Validation"])
+        print(f"  ... {trial_list[trial].get_name(model_name)} rung {rung}: "
+              f"validation MSE {metrics['MSE_Validation']:.4f}")
+
+    print(f"Tune {model_name} of {experiment.name}: {len(trial_list)} trials, rungs at {rung_epochs} epochs")
+    if jobs > 1:
+        experiment_spec = get_experiment_spec(experiment)
+        with make_pool(jobs) as executor:
+            running = {}
+            while True:
+                while len(running) < jobs:
+                    job = scheduler.next_job()
+                    if job is None:
+                        break
+                    trial, rung = job
+                    running[executor.submit(
+                        _run_trial_in_worker, experiment_spec, model_name, trial_list[trial],
+                        get_epochs(rung), weights.get(trial),
+                    )] = job
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    report(*running.pop(future), future.result())
+    else:
+        job = scheduler.next_job()
+        while job is not None:
+            trial, rung = job
+            report(trial, rung, _run_trial(experiment, model_name, trial_list[trial], get_epochs(rung),
+                                           weights.get(trial)))
+            job = scheduler.next_job()
+
+    table = pd.DataFrame.from_dict(results, orient="index")
+    table = table.sort_values(["Rung", "MSE_Validation"], ascending=[False, True])
+    table.index = [trial_list[trial].get_name(model_name) for trial in table.index]
+    for name, row in table.iterrows():
+        print(f"  {name}: rung {row['Rung']:.0f}, {row['Epochs Used']:.0f} epochs, validation MSE {row['MSE_Validation']:.4f}")
+    return table[[f"{metric}_{split}" for metric in METRICS.values() for split in SPLITS.values()]]
@@ -3,13 +3,17 @@ The wrapper for the dataset that we use. It generates windows
 of the timeseries data to learn from.
 """
 
+from functools import cached_property
+
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import tensorflow as tf
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .config import ProductIds
 
-from .config import ProductIds, denormalize_list
-from .config import denormalize
+WINDOWING_BACKENDS = ["keras", "numpy"]
 
 
 class WindowGenerator:
@@ -18,13 +22,14 @@ class WindowGenerator:
             input_width,
             label_width,
             shift,
-            train_df,
-            val_df,
-            test_df,
-            normalization_params,
+            data,
+            columns,
+            split_rows,
+            normalizers,
             time_stamps,
             label_columns=None,
-
+            windowing="keras",
+            store_ids=None,
     ):
         """
         This drawing indicates the meaning of the attributes:
@@ -36,19 +41,36 @@ class WindowGenerator:
                     <------label width-------->|
                                                |
 
+        data => the normalized float32 features of all days in one contiguous buffer:
+                (time, features), or (stores, time, features) for several stores.
+                The splits are views into it.
+        columns => the names of the features
+        split_rows => (first row of the validation split, first row of the test split)
+        windowing => "keras" (timeseries_dataset_from_array) or "numpy" (sliding_window_view)
+        normalizers => store id => the Normalizer of the store, the id is None for one time series
+        store_ids => the stores of the first axis of the data. None => one time series
         """
         if label_width > shift:
             raise ValueError("unnecessary labels included in data")
+        if windowing not in WINDOWING_BACKENDS:
+            raise ValueError(f"Unknown windowing {windowing}, allowed values: {WINDOWING_BACKENDS}")
 
         # Store the raw data.
-        self.train_df = train_df
-        self.val_df = val_df
-        self.test_df = test_df
-        self.normalization_params = normalization_params
+        self.data = np.ascontiguousarray(data, dtype=np.float32)
+        self.columns = list(columns)
+        validation_start, test_start = split_rows
+        self._split_slices = {
+            "train": slice(0, validation_start),
+            "val": slice(validation_start, test_start),
+            "test": slice(test_start, self.data.shape[-2]),
+        }
+        self.normalizers = normalizers
+        # all stores cover the same days
         self.time_stamps = [pd.Timestamp(x) for x in time_stamps]
+        self.store_ids = store_ids
 
         # Work out the label column indices.
-        self.column_indices = {name: i for i, name in enumerate(train_df.columns)}
+        self.column_indices = {name: i for i, name in enumerate(self.columns)}
         self.label_columns = label_columns
 
         if label_columns is not None:
@@ -58,12 +80,21 @@ class WindowGenerator:
         else:
             self.label_columns_indices = self.column_indices
 
+        # positions of the label columns in the features, used by the numpy windowing
+        self.label_column_positions = None
+        if label_columns is not None:
+            self.label_column_positions = np.array(
+                [self.column_indices[name] for name in label_columns]
+            )
+
         # Work out the window parameters.
         self.input_width = input_width
         self.label_width = label_width
         self.shift = shift
 
         self.total_window_size = input_width + shift
+        self.sequence_stride = 1
+        self.windowing = windowing
 
         self.input_slice = slice(0, input_width)
         self.input_indices = np.arange(self.total_window_size)[self.input_slice]
@@ -73,6 +104,7 @@ class WindowGenerator:
         self.label_indices = np.arange(self.total_window_size)[self.labels_slice]
 
         self._example = None
+        self._datasets = {}
 
     def __repr__(self):
         return "\n".join(
@@ -111,13 +143,43 @@ class WindowGenerator:
 
         return inputs, labels
 
+    def split_window_array(self, data):
+        """
+        numpy version of `split_window` for a whole split at once.
+        splits the incoming data: (time, all_features)
+        into:
+        inputs: (windows, input_width, all_features)
+        labels: (windows, label_width, #label_columns)
+
+        inputs (and labels, if all columns are labels) are strided views over `data`,
+        nothing gets copied as long as `data` is already a contiguous float32 array.
+        """
+        if np.ndim(data) == 3:
+            # (stores, time, all_features): the windows of one store after the other, none spans two stores
+            inputs, labels = zip(*(self.split_window_array(store_data) for store_data in data))
+            return np.concatenate(inputs), np.concatenate(labels)
+
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        windows = sliding_window_view(data, self.total_window_size, axis=0)
+        # (windows, all_features, time) => (windows, time, all_features)
+        windows = windows[::self.sequence_stride].transpose(0, 2, 1)
+
+        inputs = windows[:, self.input_slice, :]
+        labels = windows[:, self.labels_slice, :]
+        if self.label_column_positions is not None:
+            labels = labels[:, :, self.label_column_positions]
+
+        return inputs, labels
+
     def plot(
             self,
             model=None,
             plot_col=ProductIds.BENS_LUNCHTIME.value,
             max_subplots=3,
+            store_id=None,
     ):
         inputs, labels = self.example
+        normalizer = self.get_normalizer(store_id)
         plt.figure(figsize=(12, 8))
         plot_col_index = self.column_indices[plot_col]
 
@@ -127,7 +189,7 @@ class WindowGenerator:
             plt.ylabel(plot_col)
             plt.plot(
                 self.input_indices,
-                denormalize(inputs[n, :, plot_col_index], self.normalization_params)[plot_col],
+                normalizer.inverse_transform(np.array(inputs[n, :, plot_col_index]), [plot_col]),
                 label="Inputs",
                 marker=".",
                 zorder=-10,
@@ -140,7 +202,7 @@ class WindowGenerator:
 
             plt.scatter(
                 self.label_indices,
-                denormalize(labels[n, :, label_col_index], self.normalization_params)[plot_col],
+                normalizer.inverse_transform(np.array(labels[n, :, label_col_index]), [plot_col]),
                 edgecolors="k",
                 label="Labels",
                 c="#2ca02c",
@@ -150,7 +212,7 @@ class WindowGenerator:
             if model is not None:
                 plt.scatter(
                     self.label_indices,
-                    denormalize(model(inputs)[n, :, label_col_index], self.normalization_params)[plot_col],
+                    normalizer.inverse_transform(np.array(model(inputs)[n, :, label_col_index]), [plot_col]),
                     marker="X",
                     edgecolors="k",
                     label="Predictions",
@@ -164,26 +226,115 @@ class WindowGenerator:
             plt.xlabel("Time [day]")
 
     def make_dataset(self, data, batch_size=32, shuffle=True):
+        if self.windowing == "numpy" or np.ndim(data) == 3:
+            return self._make_numpy_dataset(data, batch_size, shuffle)
+
         return tf.keras.utils.timeseries_dataset_from_array(
-            data=np.array(data, dtype=np.float32),
+            data=np.asarray(data, dtype=np.float32),
             targets=None,
             sequence_length=self.total_window_size,
-            sequence_stride=1,
+            sequence_stride=self.sequence_stride,
             shuffle=shuffle,
             batch_size=batch_size,
         ).map(self.split_window)
 
+    def _make_numpy_dataset(self, data, batch_size, shuffle):
+        inputs, labels = self.split_window_array(data)
+        dataset = tf.data.Dataset.from_tensor_slices((inputs, labels))
+        if shuffle:
+            # draw the seed from numpy like `timeseries_dataset_from_array` does
+            dataset = dataset.shuffle(len(inputs), seed=np.random.randint(1e6))
+        return dataset.batch(batch_size)
+
+    def _get_array(self, split):
+        """
+        View of one split into the data buffer:
+        (time, all_features), or (stores, time, all_features) for several stores
+        """
+        return self.data[..., self._split_slices[split], :]
+
+    def _get_frame(self, split):
+        """
+        One split as DataFrame, a view into the data buffer for one time series.
+        For several stores it is a copy indexed by (StoreID, time step).
+        """
+        values = self._get_array(split)
+        rows = range(self._split_slices[split].start, self._split_slices[split].stop)
+        if self.store_ids is None:
+            return pd.DataFrame(values, index=pd.RangeIndex(rows.start, rows.stop), columns=self.columns, copy=False)
+        return pd.DataFrame(
+            values.reshape(-1, len(self.columns)),
+            index=pd.MultiIndex.from_product([self.store_ids, rows], names=["StoreID", None]),
+            columns=self.columns,
+        )
+
+    @property
+    def train_df(self):
+        return self._get_frame("train")
+
+    @property
+    def val_df(self):
+        return self._get_frame("val")
+
+    @property
+    def test_df(self):
+        return self._get_frame("test")
+
+    def get_split_rows(self, split):
+        """Number of days in a split"""
+        return self._get_array(split).shape[-2]
+
+    @property
+    def store_count(self):
+        return 1 if self.store_ids is None else len(self.store_ids)
+
+    def _check_store(self, store_id):
+        if store_id not in self.store_ids:
+            raise ValueError(f"Store {store_id} is not in the dataset, stores: {self.store_ids}")
+
+    def get_normalizer(self, store_id=None):
+        """The Normalizer of a store (of the data without store ids)"""
+        if self.store_ids is not None:
+            self._check_store(store_id)
+        return self.normalizers[store_id]
+
+    def _get_dataset(self, split):
+        """
+        Builds the windowed pipeline of a split once and keeps it until
+        `invalidate_cache` is called.
+        The training pipeline is not `.cache()`d, as that would freeze the
+        order of the first epoch instead of reshuffling every epoch.
+        """
+        if split not in self._datasets:
+            dataset = self.make_dataset(self._get_array(split))
+            if split != "train":
+                dataset = dataset.cache()
+            self._datasets[split] = dataset.prefetch(tf.data.AUTOTUNE)
+        return self._datasets[split]
+
+    def invalidate_cache(self, datasets_only=False):
+        """
+        Drops the cached pipelines (and the sample counts, unless `datasets_only`).
+        Has to be called after changing `data`.
+        Rebuilding only the pipelines draws a new shuffle seed from numpy.
+        """
+        self._datasets = {}
+        self._example = None
+        if not datasets_only:
+            for samples in ["train_samples", "val_samples", "test_samples", "total_samples"]:
+                self.__dict__.pop(samples, None)
+
     @property
     def train(self):
-        return self.make_dataset(self.train_df)
+        return self._get_dataset("train")
 
     @property
     def val(self):
-        return self.make_dataset(self.val_df)
+        return self._get_dataset("val")
 
     @property
     def test(self):
-        return self.make_dataset(self.test_df)
+        return self._get_dataset("test")
 
     @property
     def example(self):
@@ -196,36 +347,63 @@ class WindowGenerator:
             self._example = result
         return result
 
-    @staticmethod
-    def _count_samples(of):
-        return sum([x[0].shape[0] for x in list(of)])
+    def _count_samples(self, split):
+        """Number of windows in a split (of all stores), without iterating over the dataset."""
+        num_windows = self.get_split_rows(split) - self.total_window_size + 1
+        if num_windows <= 0:
+            return 0
+        return (num_windows + self.sequence_stride - 1) // self.sequence_stride * self.store_count
 
-    @property
+    @cached_property
     def train_samples(self):
-        return self._count_samples(self.train)
+        return self._count_samples("train")
 
-    @property
+    @cached_property
     def test_samples(self):
-        return self._count_samples(self.test)
+        return self._count_samples("test")
 
-    @property
+    @cached_property
     def val_samples(self):
-        return self._count_samples(self.val)
+        return self._count_samples("val")
 
-    @property
+    @cached_property
     def total_samples(self):
         return self.val_samples + self.test_samples + self.train_samples
 
-    def get_all_inputs_sequentially(self):
-        samples = self.make_dataset(
-            data=pd.concat([self.train_df, self.val_df, self.test_df]),
-            batch_size=1,
-            shuffle=False,
-        )
-        return np.concatenate([x[0] for x in samples], axis=0)
+    def _get_sequential_array(self, store_id=None):
+        """
+        data of train, validation and test data in chronological order (the whole buffer):
+        (time, all_features) of one store or (stores, time, all_features) of all stores
+        """
+        data = self.data
+        if self.store_ids is not None and store_id is not None:
+            self._check_store(store_id)
+            data = data[self.store_ids.index(store_id)]
+        return data
+
+    def get_all_windows_sequentially(self, store_id=None):
+        """
+        (inputs, labels) of all windows over train, validation and test data in chronological order,
+        of one store or of all stores one after the other
+        """
+        return self.split_window_array(self._get_sequential_array(store_id))
 
-    def get_feature_sequentially_with_time(self, label):
-        data = pd.concat([self.train_df, self.val_df, self.test_df])
-        labels = denormalize_list(data[label], self.normalization_params, label)
-        assert len(labels) == len(self.time_stamps)
-        return self.time_stamps, labels
+    def get_all_inputs_sequentially(self, store_id=None):
+        """
+        inputs of all windows over train, validation and test data in chronological order,
+        of one store or of all stores one after the other
+        """
+        inputs, _ = self.get_all_windows_sequentially(store_id)
+        return inputs
+
+    def get_features_sequentially_with_time(self, labels, store_id=None):
+        """denormalized values of several features of a store at once: (time, labels)"""
+        if self.store_ids is not None:
+            self._check_store(store_id)
+        data = self._get_sequential_array(store_id)[:, [self.column_indices[label] for label in labels]]
+        assert len(data) == len(self.time_stamps)
+        return self.time_stamps, self.get_normalizer(store_id).inverse_transform(data, labels)
+
+    def get_feature_sequentially_with_time(self, label, store_id=None):
+        time_stamps, values = self.get_features_sequentially_with_time([label], store_id)
+        return time_stamps, values[:, 0]
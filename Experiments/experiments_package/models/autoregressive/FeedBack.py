@@ -21,27 +21,31 @@ class FeedBack(tf.keras.Model):
         return prediction, state
 
     def call(self, inputs, training=None, mask=None):
-        # Use a TensorArray to capture dynamically unrolled outputs.
-        predictions = []
-        # Initialize the LSTM state.
+        # Initialize the LSTM state and make the first prediction.
         prediction, state = self.warmup(inputs)
 
-        # Insert the first prediction.
-        predictions.append(prediction)
+        # Use a TensorArray to capture the outputs of the decoding loop, which
+        # stays one loop in the graph (and for XLA) instead of out_steps copies.
+        predictions = tf.TensorArray(prediction.dtype, size=self.out_steps)
+        predictions = predictions.write(0, prediction)
 
-        # Run the rest of the prediction steps.
-        for n in range(1, self.out_steps):
-            # Use the last prediction as input.
-            x = prediction
-            # Execute one lstm step.
-            x, state = self.lstm_cell(x, states=state, training=training)
+        def decode_step(n, prediction, state, predictions):
+            # Use the last prediction as input and execute one lstm step.
+            x, state = self.lstm_cell(prediction, states=state, training=training)
             # Convert the lstm output to a prediction.
             prediction = self.dense(x)
-            # Add the prediction to the output.
-            predictions.append(prediction)
+            return n + 1, prediction, state, predictions.write(n, prediction)
+
+        _, _, _, predictions = tf.while_loop(
+            lambda n, *_: n < self.out_steps,
+            decode_step,
+            (tf.constant(1), prediction, state, predictions),
+            # XLA needs the bound to compute the gradients of the loop
+            maximum_iterations=self.out_steps - 1,
+        )
 
         # predictions.shape => (time, batch, features)
-        predictions = tf.stack(predictions)
+        predictions = predictions.stack()
         # predictions.shape => (batch, time, features)
         predictions = tf.transpose(predictions, [1, 0, 2])
         return predictions
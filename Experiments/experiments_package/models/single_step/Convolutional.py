@@ -1,20 +1,20 @@
 import tensorflow as tf
 
 
-def Convolutional(window_width, feature_size, label_width):
+def Convolutional(window_width, feature_size, label_width, filters=16, kernel_size=2, units=32, dropout=0.8):
     return tf.keras.Sequential(
         [
             tf.keras.layers.Conv1D(
                 input_shape=(window_width, feature_size),
-                filters=16,
-                kernel_size=(2,),
+                filters=filters,
+                kernel_size=(kernel_size,),
                 activation="relu",
             ),
             tf.keras.layers.Flatten(
-                input_shape=(window_width - 2 + 1, 16),  # window - kernel + 1
+                input_shape=(window_width - kernel_size + 1, filters),  # window - kernel + 1
             ),
-            tf.keras.layers.Dense(units=32, activation="relu"),
-            tf.keras.layers.Dropout(rate=0.8),
+            tf.keras.layers.Dense(units=units, activation="relu"),
+            tf.keras.layers.Dropout(rate=dropout),
             tf.keras.layers.Dense(units=label_width),
             tf.keras.layers.Reshape(target_shape=(label_width, 1)),
         ]
@@ -1,13 +1,13 @@
 import tensorflow as tf
 
 
-def Dense(window_width, feature_size, label_width, num_labels=1):
+def Dense(window_width, feature_size, label_width, num_labels=1, units=64, dropout=0.8):
     return tf.keras.Sequential(
         [
             tf.keras.layers.Flatten(input_shape=(window_width, feature_size)),
-            tf.keras.layers.Dense(units=64, activation="relu"),
-            tf.keras.layers.Dense(units=64, activation="relu"),
-            tf.keras.layers.Dropout(rate=0.8),
+            tf.keras.layers.Dense(units=units, activation="relu"),
+            tf.keras.layers.Dense(units=units, activation="relu"),
+            tf.keras.layers.Dropout(rate=dropout),
             tf.keras.layers.Dense(units=label_width * num_labels),
             tf.keras.layers.Reshape(target_shape=(label_width, num_labels)),
         ]
@@ -1,14 +1,14 @@
 import tensorflow as tf
 
 
-def MultiStepDense(window_width, feature_size, label_width):
+def MultiStepDense(window_width, feature_size, label_width, units=32, dropout=0.8):
     return tf.keras.Sequential(
         [
             tf.keras.layers.Flatten(input_shape=(window_width, feature_size)),
-            tf.keras.layers.Dense(units=32, activation="relu"),
-            tf.keras.layers.Dropout(rate=0.8),
-            tf.keras.layers.Dense(units=32, activation="relu"),
-            tf.keras.layers.Dropout(rate=0.8),
+            tf.keras.layers.Dense(units=units, activation="relu"),
+            tf.keras.layers.Dropout(rate=dropout),
+            tf.keras.layers.Dense(units=units, activation="relu"),
+            tf.keras.layers.Dropout(rate=dropout),
             tf.keras.layers.Dense(units=label_width),
             tf.keras.layers.Reshape(target_shape=(label_width, 1)),
         ]
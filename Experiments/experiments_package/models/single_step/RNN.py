@@ -1,15 +1,15 @@
 import tensorflow as tf
 
 
-def RNN(window_width, feature_size, label_width, num_labels=1):
+def RNN(window_width, feature_size, label_width, num_labels=1, lstm_units=16, dropout=0.9):
     return tf.keras.models.Sequential(
         [
             # Shape [batch, time, features] => [batch, time, lstm_units]
             tf.keras.layers.LSTM(
-                16, return_sequences=True, input_shape=(window_width, feature_size)
+                lstm_units, return_sequences=True, input_shape=(window_width, feature_size)
             ),
-            tf.keras.layers.Flatten(input_shape=(window_width, 16)),
-            tf.keras.layers.Dropout(rate=0.9),
+            tf.keras.layers.Flatten(input_shape=(window_width, lstm_units)),
+            tf.keras.layers.Dropout(rate=dropout),
             # Shape => [batch, time, features]
             tf.keras.layers.Dense(units=label_width * num_labels),
             tf.keras.layers.Reshape(target_shape=(label_width, num_labels)),
@@ -1,46 +1,53 @@
+import importlib
+import os
 import sys
+from typing import TYPE_CHECKING, List
 
 import typer
 
-from experiments_package.experiments import (
-    MultiOutputWithoutWeather,
-    MultiStep,
-    MultiStepWithoutWeather,
-    SingleOutputWithoutWeather,
-    SingleStepMultiOutput,
-    SingleStepSingleOutput,
-    SingleOutputNoIds,
-    SingleOutput7Days
-)
-from experiments_package.general import combine_results, Experiment
+if TYPE_CHECKING:
+    from experiments_package.general import Experiment
 
 OUTPUT_PATH = "./outputs"
 
 app = typer.Typer()
-experiments: [Experiment] = [
-    SingleStepSingleOutput("SingleOutput", OUTPUT_PATH),
-    SingleStepMultiOutput("MultiOutput", OUTPUT_PATH),
-    MultiStep("MultiStep", OUTPUT_PATH),
-    # Autoregressive("Autoregressive", OUTPUT_PATH),
-    MultiOutputWithoutWeather("MultiOutput-NoWeather", OUTPUT_PATH),
-    MultiStepWithoutWeather("MultiStep-NoWeather", OUTPUT_PATH),
-    SingleOutputWithoutWeather("SingleOutput-NoWeather", OUTPUT_PATH),
-    SingleOutputNoIds("SingleOutput-NoIds", OUTPUT_PATH),
-    SingleOutput7Days("SingleOutput-7Days", OUTPUT_PATH),
-]
-
-
-def get_experiment(exp: str) -> Experiment:
-    if exp not in [ex.name for ex in experiments]:
+
+# experiment name => class in experiments_package.experiments.
+# Experiments (and TensorFlow) are only loaded when an experiment is used.
+EXPERIMENTS = {
+    "SingleOutput": "SingleStepSingleOutput",
+    "MultiOutput": "SingleStepMultiOutput",
+    "MultiStep": "MultiStep",
+    "Autoregressive": "Autoregressive",
+    "MultiOutput-NoWeather": "MultiOutputWithoutWeather",
+    "MultiStep-NoWeather": "MultiStepWithoutWeather",
+    "SingleOutput-NoWeather": "SingleOutputWithoutWeather",
+    "SingleOutput-NoIds": "SingleOutputNoIds",
+    "SingleOutput-7Days": "SingleOutput7Days",
+    "SingleOutput-AllStores": "SingleOutputAllStores",
+}
+_loaded_experiments = {}
+
+
+def get_experiment(exp: str) -> "Experiment":
+    if exp not in EXPERIMENTS:
         typer.echo(
-            f"Allowed Values for experiment are: {str([ex.name for ex in experiments])}"
+            f"Allowed Values for experiment are: {str(list(EXPERIMENTS.keys()))}"
         )
         sys.exit(0)
 
-    return next((ex for ex in experiments if ex.name == exp))
+    if exp not in _loaded_experiments:
+        experiments_module = importlib.import_module("experiments_package.experiments")
+        experiment_class = getattr(experiments_module, EXPERIMENTS[exp])
+        _loaded_experiments[exp] = experiment_class(exp, OUTPUT_PATH)
+    return _loaded_experiments[exp]
+
+
+def get_all_experiments() -> List["Experiment"]:
+    return [get_experiment(exp) for exp in EXPERIMENTS]
 
 
-def check_model_existence(experiment: Experiment, model: str) -> bool:
+def check_model_existence(experiment: "Experiment", model: str) -> bool:
     models = experiment.get_models()
     if model not in models.keys():
         typer.echo(f"Model not existent, allowed Values: {str(models)}")
@@ -53,8 +60,8 @@ def check_model_existence(experiment: Experiment, model: str) -> bool:
 def show_experiments():
     """Show the registered Experiments"""
     typer.echo("Following experiments are registered:")
-    for exp in experiments:
-        typer.echo(f"   - {exp.name}")
+    for exp in EXPERIMENTS:
+        typer.echo(f"   - {exp}")
 
 
 @app.command("get-models")
@@ -67,51 +74,141 @@ def show_models(exp: str):
         typer.echo(f"   - {model}")
 
 
+JOBS_OPTION = typer.Option(
+    1, help="Number of processes that run models in parallel. The outputs are the same as with one process, "
+            "plus the losses.csv and results.csv of every model in <output>/<experiment>/<model>/"
+)
+RETRAIN_OPTION = typer.Option(False, "--retrain", help="Train the models again instead of using the stored models")
+BENCHMARK_OPTION = typer.Option(
+    False, "--benchmark", help="Measure the inference latency and the eager and compiled throughput for several "
+                               "batch sizes (slow), instead of only the compiled throughput for one batch size"
+)
+
+
 @app.command("run")
-def run_model(exp: str, model: str = None):
+def run_model(exp: str, model: str = None, jobs: int = JOBS_OPTION, benchmark: bool = BENCHMARK_OPTION):
     """Run an experiment with all registered models.
      -- model: only choose one model to run
     """
+    if model is not None and jobs > 1:
+        typer.echo("--jobs runs the models of a whole experiment in parallel, it can't be used with --model")
+        sys.exit(-1)
 
     experiment = get_experiment(exp)
     if model is None:
         typer.echo(f"Run {experiment.name}")
-        experiment.run()
+        if jobs > 1:
+            from experiments_package.general import run_in_parallel
+
+            run_in_parallel([experiment], jobs, benchmark=benchmark)
+        else:
+            experiment.run(benchmark=benchmark)
     else:
         check_model_existence(experiment, model)
-        experiment.run_model(model)
+        experiment.run_model(model, benchmark=benchmark)
 
 
 @app.command("run-all")
-def run_experiment(
-):
+def run_experiment(jobs: int = JOBS_OPTION, benchmark: bool = BENCHMARK_OPTION):
     """Run all experiments."""
     typer.echo("Run all experiments")
-    for experiment in experiments:
-        experiment.run()
+    if jobs > 1:
+        from experiments_package.general import run_in_parallel
+
+        run_in_parallel(get_all_experiments(), jobs, benchmark=benchmark)
+        return
+
+    for experiment in get_all_experiments():
+        experiment.run(benchmark=benchmark)
 
 
 @app.command("combine-results")
 def combine():
     """Combine all available results into one output table."""
+    from experiments_package.general import combine_results
+
     combine_results(OUTPUT_PATH)
 
 
 @app.command("output-graph")
-def output_graph(exp: str, model: str):
+def output_graph(exp: str, model: str, retrain: bool = RETRAIN_OPTION, benchmark: bool = BENCHMARK_OPTION):
     """Draw the picture of the output graph of a model and experiment"""
     experiment = get_experiment(exp)
     check_model_existence(experiment, model)
-    experiment.run_model(model, output_all_label_images=True)
+    experiment.run_model(model, output_all_label_images=True, use_stored_model=not retrain, benchmark=benchmark)
 
 
 @app.command("output-graph-all")
-def output_graph():
+def output_graph(jobs: int = JOBS_OPTION, retrain: bool = RETRAIN_OPTION, benchmark: bool = BENCHMARK_OPTION):
     """Draw the picture of the output graph of all models in all experiments"""
     typer.echo("Run all experiments")
-    for experiment in experiments:
+    if jobs > 1:
+        from experiments_package.general import run_in_parallel
+
+        run_in_parallel(get_all_experiments(), jobs, output_all_label_images=True, save_merged=False,
+                        use_stored_models=not retrain, benchmark=benchmark, save_plots=True)
+        return
+
+    for experiment in get_all_experiments():
         for model in experiment.get_models().keys():
-            experiment.run_model(model, output_all_label_images=True)
+            experiment.run_model(model, output_all_label_images=True, use_stored_model=not retrain,
+                                 benchmark=benchmark)
+
+
+@app.command("backtest")
+def backtest(exp: str, model: str, folds: int = typer.Option(5, help="Number of rolling origins"),
+             horizon: int = typer.Option(None, help="Test windows per fold (default: size of the test split)"),
+             sliding: bool = typer.Option(False, "--sliding", help="Train on a fixed number of windows per fold"),
+             jobs: int = typer.Option(1, help="Number of processes that train the folds in parallel")):
+    """Evaluate a model of an experiment on several rolling origins"""
+    from experiments_package.general import backtest
+
+    experiment = get_experiment(exp)
+    check_model_existence(experiment, model)
+    results = backtest(experiment, model, folds=folds, horizon=horizon, sliding=sliding, jobs=jobs)
+    typer.echo(results.to_string())
+
+    folder = f"{OUTPUT_PATH}/{experiment.name}/{model}"
+    os.makedirs(folder, exist_ok=True)
+    results.to_csv(f"{folder}/backtest{'_sliding' if sliding else ''}.csv")
+
+
+@app.command("tune")
+def tune(exp: str, model: str, space: str = typer.Option(..., help="JSON file: option or hyperparameter => values"),
+         min_epochs: int = typer.Option(3, help="Epochs of the first rung"),
+         max_epochs: int = typer.Option(None, help="Epochs of the last rung (default: epochs of the experiment)"),
+         reduction_factor: int = typer.Option(3, help="Only the best 1/reduction_factor of a rung are promoted"),
+         trials: int = typer.Option(None, help="Number of random combinations of the space (default: all)"),
+         jobs: int = typer.Option(1, help="Number of processes that train the trials in parallel")):
+    """Search the dataset options and hyperparameters of a model with successive halving (ASHA)"""
+    from experiments_package.general import load_search_space, tune
+
+    experiment = get_experiment(exp)
+    check_model_existence(experiment, model)
+    results = tune(experiment, model, load_search_space(space), min_epochs=min_epochs, max_epochs=max_epochs,
+                   reduction_factor=reduction_factor, trials=trials, jobs=jobs)
+
+    folder = f"{OUTPUT_PATH}/{experiment.name}/{model}"
+    os.makedirs(folder, exist_ok=True)
+    results.to_csv(f"{folder}/tune_{os.path.splitext(os.path.basename(space))[0]}.csv")
+
+
+@app.command("serve")
+def serve(models: List[str] = typer.Argument(..., help="Stored models as <experiment>/<model>, e.g. SingleOutput/Dense"),
+          host: str = typer.Option("127.0.0.1", help="Address the service listens on"),
+          port: int = typer.Option(8000, help="Port the service listens on"),
+          max_batch_size: int = typer.Option(64, help="Requests of a model that are predicted in one call"),
+          max_delay: float = typer.Option(2.0, help="Milliseconds a batch waits for more requests")):
+    """Serve forecasts of stored models over HTTP, see experiments_package/general/serving.py"""
+    from experiments_package.general import serve
+
+    served = []
+    for name in models:
+        exp, _, model = name.partition("/")
+        experiment = get_experiment(exp)
+        check_model_existence(experiment, model)
+        served.append((experiment, model))
+    serve(served, host=host, port=port, max_batch_size=max_batch_size, max_delay_ms=max_delay)
 
 
 if __name__ == "__main__":
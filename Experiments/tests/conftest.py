@@ -0,0 +1,28 @@
+"""
+The tests run from the Experiments directory like main.py, as the experiments load their data from "./../Data".
+Tests that need the imputed features CSV are skipped without it.
+"""
+
+import os
+import sys
+
+import pytest
+
+EXPERIMENTS_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_ORIGIN = "./../Data/merged_cleaned_FE_imputed(v)_w.csv"
+
+sys.path.insert(0, EXPERIMENTS_FOLDER)
+# the experiment modules read the menu relative to the working directory when they are imported
+os.chdir(EXPERIMENTS_FOLDER)
+
+
+@pytest.fixture(autouse=True)
+def experiments_folder(monkeypatch):
+    monkeypatch.chdir(EXPERIMENTS_FOLDER)
+
+
+@pytest.fixture
+def data_origin(experiments_folder):
+    if not os.path.exists(DATA_ORIGIN):
+        pytest.skip(f"{DATA_ORIGIN} is missing")
+    return DATA_ORIGIN
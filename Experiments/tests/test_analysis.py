@@ -0,0 +1,191 @@
+import dataclasses
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from experiments_package import experiments
+from experiments_package.general import analysis
+from experiments_package.general.data import get_all_product_ids, get_no_sushi_in_product
+
+RESULTS_FOLDER = "./outputs"
+# experiment => name of its results, models in them that are not trained
+SAVED_RESULTS = [
+    (experiments.SingleStepSingleOutput, "SingleOutput", ["Persistence"]),
+    (experiments.SingleOutputWithoutWeather, "SingleOutput-NoWeather", ["Persistence"]),
+    (experiments.SingleOutputNoIds, "SingleOutput-NoIds", ["Persistence"]),
+    (experiments.SingleOutput7Days, "SingleOutput-7Days", ["Persistence", "PersistenceSameDayLastWeek"]),
+    (experiments.SingleStepMultiOutput, "MultiOutput", ["Baseline"]),
+    (experiments.MultiOutputWithoutWeather, "MultiOutput-NoWeather", ["Baseline"]),
+    (experiments.MultiStep, "MultiStep", ["RepeatBaseline", "MultiStepLastBasline"]),
+    (experiments.MultiStepWithoutWeather, "MultiStep-NoWeather", ["RepeatBaseline", "MultiStepLastBasline"]),
+]
+
+
+class FixedModel:
+    """Predicts the last input day of every label plus a fixed offset per label, so some sets are off"""
+
+    def __init__(self, window_generator):
+        self.window_generator = window_generator
+        labels = list(window_generator.label_columns_indices.keys())
+        self.label_positions = [window_generator.column_indices[label] for label in labels]
+        self.offsets = np.linspace(-1.5, 1.5, len(labels), dtype=np.float32)
+
+    def predict(self, inputs, batch_size=None, verbose=0):
+        last_day = inputs[:, -1:, self.label_positions] + self.offsets
+        return np.repeat(last_day, self.window_generator.label_width, axis=1)
+
+
+def _get_product_ids(window_generator):
+    product_ids = [p_id for p_id in get_all_product_ids() if p_id in window_generator.column_indices.keys()]
+    if window_generator.label_columns is not None:
+        product_ids = [p_id for p_id in product_ids if p_id in window_generator.label_columns]
+    return product_ids
+
+
+def _get_sushi_sums_with_loop(model, window_generator):
+    """The former implementation: product id => (wasted, not enough, days), one prediction run per product"""
+    sums = {}
+    for p_id in _get_product_ids(window_generator):
+        pred_time, predictions = analysis.get_model_predictions_sequentially_with_time(
+            model, window_generator, label=p_id
+        )
+        label_time, labels = window_generator.get_feature_sequentially_with_time(p_id)
+        combined_times = list(set(pred_time) & set(label_time))
+        beginning = min(combined_times)
+        end = max(combined_times)
+        pred_time = pd.Series(sorted(list(pred_time)))
+        label_time = pd.Series(sorted(list(label_time)))
+
+        pred_slice = slice(pred_time[pred_time == beginning].index[0], list(pred_time[pred_time == end].index)[-1])
+        label_slice = slice(label_time[label_time == beginning].index[0], list(label_time[label_time == end].index)[-1])
+
+        predictions = np.rint(np.array(predictions[pred_slice])).reshape((-1,))
+        labels = np.rint(np.array(labels[label_slice])).reshape((-1,))
+
+        sushi_in_product = get_no_sushi_in_product(p_id)
+        sums[p_id] = (
+            np.sum(np.maximum(predictions - labels, 0)) * sushi_in_product,
+            np.sum(np.maximum(labels - predictions, 0)) * sushi_in_product,
+            len(labels),
+        )
+    return sums
+
+
+def _get_sushi_stats_with_loop(model, window_generator):
+    sums = _get_sushi_sums_with_loop(model, window_generator).values()
+    total_days = sum(days for _, _, days in sums)
+    if total_days == 0:
+        return 0, 0
+    wasted = sum(wasted for wasted, _, _ in sums)
+    not_enough = sum(not_enough for _, not_enough, _ in sums)
+    return int(np.rint(wasted / total_days)), int(np.rint(not_enough / total_days))
+
+
+def test_sushi_differences_of_fixed_matrices():
+    product_ids = get_all_product_ids()[:3]
+    predictions = np.array([[1.4, 2.6, 0.0], [3.0, 0.4, 5.5], [2.2, 1.0, 1.6]])
+    labels = np.array([[1.0, 2.0, 1.0], [1.0, 2.0, 3.0], [2.0, 1.0, 4.0]])
+
+    wasted, not_enough = analysis.get_sushi_differences(predictions, labels, product_ids)
+
+    pieces = [get_no_sushi_in_product(p_id) for p_id in product_ids]
+    for day in range(len(labels)):
+        for product, p_id in enumerate(product_ids):
+            difference = np.rint(predictions[day, product]) - np.rint(labels[day, product])
+            assert wasted[day, product] == max(difference, 0) * pieces[product]
+            assert not_enough[day, product] == max(-difference, 0) * pieces[product]
+    assert analysis.average_sushi_per_day(wasted, not_enough) == (
+        int(np.rint(wasted.sum() / 9)), int(np.rint(not_enough.sum() / 9))
+    )
+
+
+@pytest.mark.parametrize(
+    "experiment_class",
+    [experiments.SingleStepSingleOutput, experiments.SingleStepMultiOutput, experiments.MultiStep],
+    ids=lambda experiment_class: experiment_class.__name__,
+)
+def test_sushi_stats_match_the_loop(experiment_class, data_origin, tmp_path):
+    window_generator = experiment_class(experiment_class.__name__, str(tmp_path)).data
+    model = FixedModel(window_generator)
+
+    assert analysis.get_sushi_stats(model, window_generator) == _get_sushi_stats_with_loop(model, window_generator)
+
+    breakdown = analysis.get_sushi_breakdown(model, window_generator)
+    for p_id, (wasted, not_enough, days) in _get_sushi_sums_with_loop(model, window_generator).items():
+        assert breakdown[("wasted", p_id)].sum() == pytest.approx(wasted)
+        assert breakdown[("not_enough", p_id)].sum() == pytest.approx(not_enough)
+        assert len(breakdown) == days
+
+
+def test_predictions_follow_the_weights_of_a_fitted_model(data_origin, tmp_path):
+    experiment = experiments.SingleStepSingleOutput("SingleOutput", str(tmp_path))
+    experiment.training_options = dataclasses.replace(experiment.training_options, max_epochs=1)
+    window_generator = experiment.data
+    model = experiment.get_models()["Linear"]
+    experiment.compile_and_fit(model)
+    before = analysis.get_sequential_predictions(model, window_generator).values.copy()
+
+    # fitted further, like a warm start
+    experiment.compile_and_fit(model)
+    after = analysis.get_sequential_predictions(model, window_generator).values
+
+    assert not np.allclose(before, after)
+    np.testing.assert_allclose(after, analysis.SequentialPredictions(model, window_generator).values)
+
+
+def _get_saved_sushi_stats(name, model_name):
+    results = pd.read_csv(f"{RESULTS_FOLDER}/{name}_results.csv", header=[0, 1], index_col=0)
+    row = results[results[("Model", "Name")] == model_name].iloc[0]
+    return (
+        int(row[("Performance", "Avg. Sushi wasted /day")]),
+        int(row[("Performance", "Avg. sushi not enough /day")]),
+    )
+
+
+@pytest.mark.parametrize(
+    "experiment_class, name, model_name",
+    [(experiment_class, name, model_name) for experiment_class, name, models in SAVED_RESULTS for model_name in models],
+    ids=lambda value: getattr(value, "__name__", value),
+)
+def test_sushi_stats_match_the_saved_results(experiment_class, name, model_name, data_origin, tmp_path):
+    experiment = experiment_class(name, str(tmp_path))
+    model = experiment.get_models()[model_name]
+
+    assert analysis.get_sushi_stats(model, experiment.data) == _get_saved_sushi_stats(name, model_name)
+
+
+def _get_saved_sushi_stats_of_model(experiment, model_name):
+    results = pd.read_csv(f"{experiment._get_model_output_folder(model_name)}/results.csv", header=[0, 1], index_col=0)
+    row = results.iloc[0]
+    return (
+        int(row[("Performance", "Avg. Sushi wasted /day")]),
+        int(row[("Performance", "Avg. sushi not enough /day")]),
+    )
+
+
+@pytest.mark.parametrize(
+    "experiment_class, name, model_name",
+    [
+        (experiments.SingleStepSingleOutput, "SingleOutput", "Linear"),
+        (experiments.SingleStepMultiOutput, "MultiOutput", "Dense"),
+        (experiments.MultiStep, "MultiStep", "Mutli Linear"),
+    ],
+    ids=lambda value: getattr(value, "__name__", value),
+)
+def test_stored_models_match_the_saved_results(experiment_class, name, model_name, data_origin, tmp_path):
+    def make_experiment():
+        experiment = experiment_class(name, str(tmp_path))
+        experiment.training_options = dataclasses.replace(experiment.training_options, max_epochs=1)
+        return experiment
+
+    experiment = make_experiment()
+    experiment.run_model(model_name)
+
+    # a new run loads the model the first one stored
+    other = make_experiment()
+    loaded = other.load_stored_model(model_name)
+
+    assert loaded is not None
+    model, _ = loaded
+    assert analysis.get_sushi_stats(model, other.data) == _get_saved_sushi_stats_of_model(experiment, model_name)
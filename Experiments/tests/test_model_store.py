@@ -0,0 +1,56 @@
+import dataclasses
+
+import numpy as np
+import pandas as pd
+
+from experiments_package import experiments
+
+
+def _make_experiment(data_origin, output_folder):
+    experiment = experiments.SingleStepSingleOutput("SingleOutput", output_folder)
+    experiment.dataset_options = dataclasses.replace(experiment.dataset_options, data_origin=data_origin)
+    experiment.training_options = dataclasses.replace(experiment.training_options, max_epochs=1)
+    return experiment
+
+
+def _store_model(experiment, model_name):
+    model = experiment.get_models()[model_name]
+    experiment._fitting_model = (model_name, False)
+    try:
+        experiment.compile_and_fit(model)
+    finally:
+        experiment._fitting_model = None
+    return model
+
+
+def test_latest_stored_model_is_loaded_after_new_data(data_origin, tmp_path):
+    data = pd.read_csv(data_origin)
+    csv_file = str(tmp_path / "imputed.csv")
+    # the data without its last week, the week is "ingested" afterwards
+    dates = sorted(data["Date"].unique())
+    data[data["Date"] < dates[-7]].to_csv(csv_file, index=False)
+    experiment = _make_experiment(csv_file, str(tmp_path / "outputs"))
+    model = _store_model(experiment, "Linear")
+    trained_normalizers = experiment.data.normalizers
+
+    data.to_csv(csv_file, index=False)
+    updated = _make_experiment(csv_file, str(tmp_path / "outputs"))
+    loaded = updated.load_stored_model("Linear")
+
+    assert loaded is not None
+    loaded_model, normalizers = loaded
+    for loaded_weights, weights in zip(loaded_model.get_weights(), model.get_weights()):
+        np.testing.assert_array_equal(loaded_weights, weights)
+    # the normalization of the training data, not of the new data
+    np.testing.assert_array_equal(normalizers[None].mean, trained_normalizers[None].mean)
+    assert not np.array_equal(normalizers[None].mean, updated.data.normalizers[None].mean)
+
+
+def test_stored_model_of_other_dataset_options_is_not_loaded(data_origin, tmp_path):
+    experiment = _make_experiment(data_origin, str(tmp_path))
+    _store_model(experiment, "Linear")
+
+    other = _make_experiment(data_origin, str(tmp_path))
+    other.dataset_options = dataclasses.replace(other.dataset_options, window_width=5)
+
+    assert other.load_stored_model("Linear") is None
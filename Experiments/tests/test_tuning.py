@@ -0,0 +1,29 @@
+import pytest
+
+from experiments_package import experiments
+from experiments_package.general import tuning
+
+
+@pytest.mark.parametrize(
+    "experiment_class, model_name, search_space, message",
+    [
+        (experiments.SingleOutputNoIds, "Dense", {"window_width": [3, 5]}, "SingleOutputNoIds builds its models"),
+        (experiments.MultiStep, "Multi Dense", {"units": [8, 16]}, "MultiStep builds its models"),
+        (experiments.SingleStepSingleOutput, "Dense", {"filters": [8]}, "keyword arguments of Dense"),
+        (experiments.SingleStepSingleOutput, "Linear", {"units": [8]}, "keyword arguments of Linear"),
+    ],
+)
+def test_search_spaces_without_effect_are_rejected(experiment_class, model_name, search_space, message,
+                                                   data_origin, tmp_path):
+    experiment = experiment_class(experiment_class.__name__, str(tmp_path))
+
+    with pytest.raises(ValueError, match=message):
+        tuning.tune(experiment, model_name, search_space, min_epochs=1, max_epochs=1)
+
+
+def test_search_space_of_dataset_options_and_keywords_is_accepted(data_origin, tmp_path):
+    experiment = experiments.SingleStepSingleOutput("SingleOutput", str(tmp_path))
+
+    tuning._check_search_space(
+        experiment, "Dense", tuning.make_trials({"window_width": [2, 4], "units": [8], "dropout": [0.2]})
+    )
@@ -0,0 +1,39 @@
+import dataclasses
+
+import pytest
+
+from experiments_package import experiments
+from experiments_package.general.data import get_window_dataset
+from experiments_package.general.window_generator import WINDOWING_BACKENDS
+
+EXPERIMENTS = [
+    experiments.SingleStepSingleOutput,
+    experiments.SingleStepMultiOutput,
+    experiments.MultiStep,
+    experiments.Autoregressive,
+    experiments.MultiOutputWithoutWeather,
+    experiments.SingleOutputWithoutWeather,
+    experiments.MultiStepWithoutWeather,
+    experiments.SingleOutputNoIds,
+    experiments.SingleOutput7Days,
+    experiments.SingleOutputAllStores,
+]
+
+
+def _iterate_and_count(dataset):
+    """The former count: the windows of all batches of the pipeline"""
+    return sum(len(inputs) for inputs, _ in dataset)
+
+
+@pytest.mark.parametrize("windowing", WINDOWING_BACKENDS)
+@pytest.mark.parametrize("experiment_class", EXPERIMENTS, ids=lambda experiment_class: experiment_class.__name__)
+def test_sample_counts_match_the_pipelines(experiment_class, windowing, data_origin, tmp_path):
+    options = experiment_class(experiment_class.__name__, str(tmp_path)).dataset_options
+    window_generator = get_window_dataset(dataclasses.replace(options, windowing=windowing))
+
+    assert window_generator.train_samples == _iterate_and_count(window_generator.train)
+    assert window_generator.val_samples == _iterate_and_count(window_generator.val)
+    assert window_generator.test_samples == _iterate_and_count(window_generator.test)
+    assert window_generator.total_samples == (
+        window_generator.train_samples + window_generator.val_samples + window_generator.test_samples
+    )
@@ -0,0 +1,83 @@
+"""
+Compares the grid imputation of feature_engineering.impute_grid with the former itertools/merge imputation.
+The sales of Data/merged_cleaned.csv are copied to new stores to get 10x and 100x the store/product pairs.
+
+Usage (from the repository root):
+    python src/benchmark_impute.py
+    python src/benchmark_impute.py --skip-reference 100
+"""
+
+import argparse
+import time
+from itertools import product
+
+import pandas as pd
+
+from feature_engineering import impute_grid
+
+SCALES = [1, 10, 100]
+
+
+def impute_reference(df):
+    # the imputation before the grid engine, kept to compare the results and the timings
+    df['Date'] = pd.to_datetime(df['Date'])
+    df1 = pd.DataFrame(columns=['Date', 'StoreID', 'ProductID'])
+    df1['Date'] = pd.date_range(start=df['Date'].min(), end=df['Date'].max())
+
+    dates = df1['Date'].unique()
+    stores = df['StoreID'].unique()
+    products = df['ProductID'].unique()
+    all = list(product(dates, stores, products))
+
+    df2 = pd.DataFrame(all, columns=['Date', 'StoreID', 'ProductID'])
+
+    df3 = pd.merge(df2, df[['Date', 'StoreID', 'ProductID', 'Quantity', 'Price']], how='left', on=['Date', 'StoreID', 'ProductID'])
+    df3['Quantity'] = df3['Quantity'].fillna(0)
+    general_avg = df3['Price'].mean()
+    df3['Price_store_avg'] = df3.groupby(['StoreID', 'ProductID'])['Price'].transform(lambda x: x.fillna(x.mean()))
+    df3['Price_product_avg'] = df3['Price_store_avg'].fillna(df3.groupby(['ProductID'])['Price'].transform(lambda x: x.fillna(x.mean())))
+    df3['Price_imputed'] = df3['Price_product_avg'].fillna(general_avg)
+    return df3.drop(['Price', 'Price_store_avg', 'Price_product_avg'], axis=1)
+
+
+def scale_sales(df, scale):
+    # every copy gets its own store ids, so the number of store/product pairs grows by the scale
+    copies = []
+    for copy in range(scale):
+        scaled = df.copy()
+        scaled['StoreID'] = scaled['StoreID'] + copy * 10**13
+        copies.append(scaled)
+    return pd.concat(copies, ignore_index=True)
+
+
+def measure(impute, df):
+    before = time.perf_counter()
+    result = impute(df.copy())
+    return time.perf_counter() - before, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--skip-reference', type=int, nargs='*', default=[], help='scales without the slow reference run')
+    args = parser.parse_args()
+
+    sales = pd.read_csv('Data/merged_cleaned.csv')
+    for scale in SCALES:
+        df = scale_sales(sales, scale)
+        pairs = df[['StoreID', 'ProductID']].drop_duplicates().shape[0]
+        grid_time, grid = measure(impute_grid, df)
+        categorical_time, categorical = measure(lambda x: impute_grid(x, categorical_keys=True), df)
+        line = (
+            f'{scale:>4}x  {len(grid):>9} rows  {pairs:>6} pairs  '
+            f'grid {grid_time:8.3f}s {grid.memory_usage(deep=True).sum() / 2**20:8.1f}MB  '
+            f'categorical {categorical_time:8.3f}s {categorical.memory_usage(deep=True).sum() / 2**20:8.1f}MB'
+        )
+        if scale not in args.skip_reference:
+            reference_time, reference = measure(impute_reference, df)
+            pd.testing.assert_frame_equal(grid, reference)
+            line += f'  reference {reference_time:8.3f}s {reference.memory_usage(deep=True).sum() / 2**20:8.1f}MB'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
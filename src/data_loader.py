@@ -1,61 +1,67 @@
 import pandas as pd
-import os 
-import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
 
 
-def convert_to_csv(folder_path, destination_path, column_names):
-    for filename in os.listdir(folder_path):
-        df = pd.read_csv(folder_path + '/' + filename, sep=';', names=column_names)
-        df.to_csv(destination_path + '/' + filename[:-4] + '.csv', index=False)
+COLUMN_TYPES = {
+    'StoreID': 'int64',
+    'ProductID': 'int64',
+    'Quantity': 'int64',
+    'Price': 'float64',
+    'Quantity_perWeek': 'int64',
+    'Price_Total_perOrder': 'float64',
+}
+# every column, so the order of the cleaned data does not depend on the order of the reports
+SORT_COLUMNS = ['Date'] + list(COLUMN_TYPES)
 
-    sum = 0
-    for df in glob.glob(os.path.join(destination_path, "*.csv")):
-        sum += len(pd.read_csv(df).index)
 
+def read_report(path, column_names):
+    '''
+    Parses one ;-separated weekly report, converting the decimal commas while parsing.
+    Rows that are not made of all the columns (e.g. a , instead of a ;) are dropped before typing.
+    Returns the report and the number of parsed rows.
+    '''
+    df = pd.read_csv(path, sep=';', names=column_names, decimal=',')
+    rows = len(df.index)
+    df = df.dropna()
+    df['Date'] = pd.to_datetime(df['Date'], format='%Y%m%d')
+    # Quantities are written like 1,000 so they are parsed as floats first
+    df = df.astype({column: ('float64' if type == 'int64' else type) for column, type in COLUMN_TYPES.items()})
+    return df.astype(COLUMN_TYPES), rows
 
-    all_files = glob.glob(os.path.join(destination_path, "*.csv"))
-    df_from_each_file = (pd.read_csv(f) for f in all_files)
-    df_merged = pd.concat(df_from_each_file, ignore_index=True)
 
-    df_merged = df_merged.dropna()
-    df_merged = df_merged.drop_duplicates()
-    df_merged = df_merged.reset_index(drop=True)
-    
-    if sum - 3 == len(df_merged.index):
-        df_merged.to_csv('Data/merged_raw.csv', index=False)
-        print('Success')
+def load_reports(folder_path, column_names, jobs=None, filenames=None):
+    '''
+    Parses every report of folder_path (or only filenames) once, in parallel over jobs processes (all cpus by default).
+    Returns the merged reports in file name order and the number of rows parsed from all reports.
+    '''
+    filenames = sorted(os.listdir(folder_path) if filenames is None else filenames)
+    paths = [os.path.join(folder_path, filename) for filename in filenames]
+    jobs = jobs or os.cpu_count()
+    if jobs == 1:
+        reports = [read_report(path, column_names) for path in paths]
     else:
-        print('length of merged file is not equal to the sum of all files')
-        print('length of merged file: ', len(df_merged.index))
-        print('sum of all files: ', sum)
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            reports = list(executor.map(read_report, paths, [column_names] * len(paths)))
 
-    return df_merged
+    return pd.concat([df for df, _ in reports], ignore_index=True), sum(rows for _, rows in reports)
 
-def clean_data(df):
-    df['Date'] = pd.to_datetime(df['Date'], format='%Y%m%d')
-    
-    df['Quantity'] = df['Quantity'].str.replace(',', '.')
-    df['Quantity_perWeek'] = df['Quantity_perWeek'].str.replace(',', '.')
-    df['Price'] = df['Price'].str.replace(',', '.')
-    df['Price_Total_perOrder'] = df['Price_Total_perOrder'].str.replace(',', '.')
-
-    df['Quantity'] = df['Quantity'].astype(float).astype(int)
-    df['Quantity_perWeek'] = df['Quantity_perWeek'].astype(float).astype(int)
-    df['Price'] = df['Price'].astype(float)
-    df['Price_Total_perOrder'] = df['Price_Total_perOrder'].astype(float)
-
-    df = df.sort_values(by=['Date'])
-    df = df.reset_index(drop=True)
 
-    df = df.dropna()
+def clean_data(df, rows=None, destination='Data/merged_cleaned.csv'):
+    df = df.sort_values(by=SORT_COLUMNS)
     df = df.drop_duplicates()
     df = df.reset_index(drop=True)
 
-    df.to_csv('Data/merged_cleaned.csv', index=False)
+    if rows is not None:
+        print('Parsed {} rows, dropped {} malformed or duplicated rows'.format(rows, rows - len(df.index)))
+
+    df.to_csv(destination, index=False)
+    return df
 
 
 if __name__ == '__main__':
-    folder_path = 'Data/Raw'
-    destination_path = 'Data/CSV'
+    folder_path = 'Data/Raw/text'
     column_names = ['Date', 'StoreID', 'ProductID', 'Quantity', 'Price', 'Quantity_perWeek', 'Price_Total_perOrder']
-    clean_data(convert_to_csv(folder_path, destination_path, column_names))
\ No newline at end of file
+    df, rows = load_reports(folder_path, column_names)
+    df.to_csv('Data/merged_raw.csv', index=False)
+    clean_data(df, rows)
@@ -1,56 +1,109 @@
 import pandas as pd 
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
+PARTITIONED_PATH = 'Data/Partitioned'
 
-def groupby_storeid(dataset):
-    dataset['Date'] = pd.to_datetime(dataset['Date'])
-    grouped = dataset.groupby('StoreID')
-    for storeID, group in dataset.groupby('StoreID'):
-        group = group.drop(columns=['StoreID'])
-        group = group.sort_values(by=['Date'])
-        group = group.reset_index(drop=True)
-        group.to_csv('Data/Store/' + str(storeID) + '.csv', index=False)
 
-        group = group.set_index(['ProductID', 'WeekoftheYear', 'Date'])
-        group = group.sort_index(level=0)
-        group = group[['Price', 'Quantity', 'Price_Total_perOrder', 'Quantity_perWeek']]
-        group.to_csv('Data/Products/{}/'.format(str(storeID)) + str(storeID) + '.csv', index=True)
+def weekly_sum(store_ids, destination=PARTITIONED_PATH):
+    '''
+    Writes the weekly Quantity sums of write_partitioned of every store to Data/Products/<StoreID>/weekly_sum.csv.
+    '''
+    for store_id in store_ids:
+        store = read_partitioned('weekly_sum', store_id=store_id, destination=destination)
+        store = store.rename(columns={'product': 'ProductID'})
+        store = store.sort_values(by=['ProductID', 'WeekoftheYear'])
+        store = store[['ProductID', 'EAN', 'WeekoftheYear', 'Quantity_sum']]
+        os.makedirs('Data/Products/{}'.format(store_id), exist_ok=True)
+        store.to_csv('Data/Products/{}/weekly_sum.csv'.format(store_id), index=False)
 
 
-def weekly_sum(store_ids=None):
-    for store_id in store_ids:
-        store = pd.read_csv('Data/Store/{}.csv'.format(store_id))
-        store['Date'] = pd.to_datetime(store['Date'])
-        store['EAN'] = store['ProductID'].map(maps)
-        store = store.set_index(['ProductID', 'EAN', 'WeekoftheYear'])
-        store = store.sort_index(level=0)
+def week_of_year(dates):
+    # week of the year starting on Sundays, like strftime('%U')
+    return ((dates.dt.dayofyear + 6 - (dates.dt.dayofweek + 1) % 7) // 7).astype(int)
+
+
+def weekly_sums(sales, maps):
+    '''
+    Sums the Quantity of the cleaned sales per StoreID, ProductID and WeekoftheYear, like weekly_sum for every store.
+    '''
+    sales = sales[['StoreID', 'ProductID', 'Quantity']].assign(WeekoftheYear=week_of_year(sales['Date']))
+    sales['EAN'] = sales['ProductID'].map(maps)
+    weekly = sales.groupby(['StoreID', 'ProductID', 'EAN', 'WeekoftheYear'], dropna=False)['Quantity'].sum()
+    return weekly.rename('Quantity_sum').reset_index()
 
-        store['Quantity_sum'] = store.groupby(level=[0, 2])['Quantity'].transform('sum')
-        store = store[['Quantity_sum']]
-        store = store.reset_index()
-        store = store.drop_duplicates(subset=['ProductID', 'EAN', 'WeekoftheYear'])
-        store = store.to_csv('Data/Products/{}/weekly_sum.csv'.format(store_id), index=False)
 
+def update_weekly_sums(weekly, sales, new_sales, maps):
+    '''
+    Recomputes the sums of the weeks of the stores that got new sales, the other sums of weekly are kept.
+    '''
+    touched = pd.MultiIndex.from_arrays([new_sales['StoreID'], week_of_year(new_sales['Date'])]).unique()
+    affected = pd.MultiIndex.from_arrays([sales['StoreID'], week_of_year(sales['Date'])]).isin(touched)
+    kept = ~pd.MultiIndex.from_frame(weekly[['StoreID', 'WeekoftheYear']]).isin(touched)
+    weekly = pd.concat([weekly[kept], weekly_sums(sales[affected], maps)], ignore_index=True)
+    return weekly.sort_values(['StoreID', 'ProductID', 'EAN', 'WeekoftheYear']).reset_index(drop=True)
 
-def groupby_week(store_ids=None):
+
+def groupby_week(store_ids, destination=PARTITIONED_PATH):
+    '''
+    Writes the sales of write_partitioned of every product of the stores, sorted by WeekoftheYear,
+    to Data/Products/<StoreID>/weekly/<ProductID>.csv.
+    '''
     for store_id in store_ids:
-        store = pd.read_csv('Data/Store/{}.csv'.format(store_id))
-        store['Date'] = pd.to_datetime(store['Date'])
-        store['EAN'] = store['ProductID'].map(maps)
-        store = store.groupby(['ProductID', 'EAN'])
+        store = read_partitioned('sales', store_id=store_id, destination=destination)
+        os.makedirs('Data/Products/{}/weekly'.format(store_id), exist_ok=True)
+
+        for product_id, group in store.groupby('product'):
+            group = group.sort_values(by=['WeekoftheYear'], kind='stable')
+            group = group.drop(columns=['store', 'product', 'EAN', 'WeekoftheYear'])
+            group.to_csv('Data/Products/{}/weekly/'.format(store_id) + str(product_id) + '.csv', index=False)
+
+
+def write_partitioned(dataset, maps, destination=PARTITIONED_PATH, jobs=None):
+    '''
+    Writes, in one scan of the cleaned sales, the sales of every store and product to
+    <destination>/sales/store=<StoreID>/product=<ProductID>/ and their weekly Quantity sums to
+    <destination>/weekly_sum/store=<StoreID>/product=<ProductID>/. The partitions are written by jobs threads.
+    '''
+    dataset = dataset.assign(WeekoftheYear=week_of_year(dataset['Date']), EAN=dataset['ProductID'].map(maps))
+    dataset = dataset.sort_values(by=['Date'], kind='stable')
+
+    for table in ['sales', 'weekly_sum']:
+        shutil.rmtree(os.path.join(destination, table), ignore_errors=True)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        partitions = [
+            executor.submit(_write_partition, destination, store_id, product_id, group)
+            for (store_id, product_id), group in dataset.groupby(['StoreID', 'ProductID'])
+        ]
+        for partition in partitions:
+            partition.result()
+
+
+def _write_partition(destination, store_id, product_id, group):
+    partition = 'store={}/product={}'.format(store_id, product_id)
+    group = group.drop(columns=['StoreID', 'ProductID']).reset_index(drop=True)
+    weekly = group.groupby(['EAN', 'WeekoftheYear'], dropna=False)['Quantity'].sum().rename('Quantity_sum').reset_index()
+    for table, df in [('sales', group), ('weekly_sum', weekly)]:
+        os.makedirs(os.path.join(destination, table, partition))
+        df.to_parquet(os.path.join(destination, table, partition, 'part-0.parquet'), index=False)
+
 
-        for name, group in store:
-            group = pd.DataFrame(group)
-            group = group.set_index(['ProductID', 'EAN', 'WeekoftheYear'])
-            group = group.sort_index(level=2)
-            group.to_csv('Data/Products/{}/weekly/'.format(store_id) + str(name[0]) + '.csv', index=False)
+def read_partitioned(table, store_id=None, product_id=None, destination=PARTITIONED_PATH):
+    '''
+    Reads the sales or weekly_sum of write_partitioned, only the partitions of store_id and/or product_id are read.
+    '''
+    import pyarrow as pa
+    import pyarrow.dataset as ds
 
+    partitioning = ds.partitioning(pa.schema([('store', pa.int64()), ('product', pa.int64())]), flavor='hive')
+    filters = [(key, '=', value) for key, value in [('store', store_id), ('product', product_id)] if value is not None]
+    return pd.read_parquet(os.path.join(destination, table), filters=filters or None, partitioning=partitioning)
 
 
 if __name__ == '__main__':
-    df = pd.read_csv('Data/merged_cleaned_FE.csv')
+    df = pd.read_csv('Data/merged_cleaned.csv', parse_dates=['Date'])
     maps = pd.read_csv('Data/products_map.csv')
     maps = maps.set_index('EAN')['Nummer'].to_dict()
-    store_ids = df['StoreID'].unique()
-    groupby_storeid(df)
-    weekly_sum(store_ids)
-    groupby_week(store_ids)
\ No newline at end of file
+    write_partitioned(df, maps)
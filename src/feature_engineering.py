@@ -1,31 +1,65 @@
 import pandas as pd 
 from datetime import date
 import holidays
-from itertools import product
 import calendar
+import numpy as np
 
-def impute(df):
+def impute_grid(df, categorical_keys=False):
+    """
+    Builds every (Date, StoreID, ProductID) combination between the first and last date.
+    Missing sales get a Quantity of 0, missing prices are filled with the mean price of the
+    product in the store, else of the product in all stores, else of all products.
+
+    categorical_keys => return the keys as categoricals (small integer codes) instead of datetime/int64 columns
+    """
+    keys = ['Date', 'StoreID', 'ProductID']
     df['Date'] = pd.to_datetime(df['Date'])
-    df1 = pd.DataFrame(columns=['Date', 'StoreID', 'ProductID'])
-    df1['Date'] = pd.date_range(start=df['Date'].min(), end=df['Date'].max())
-    
-    dates = df1['Date'].unique()
-    stores = df['StoreID'].unique()
-    products = df['ProductID'].unique()
-    all = list(product(dates, stores, products))
-    
-    df2 = pd.DataFrame(all, columns=['Date', 'StoreID', 'ProductID'])
-    
-    df3 = pd.merge(df2, df[['Date', 'StoreID', 'ProductID', 'Quantity', 'Price']], how='left', on=['Date', 'StoreID', 'ProductID'])
-    df3['Quantity'] = df3['Quantity'].fillna(0)
-    general_avg = df3['Price'].mean()
-    df3['Price_store_avg'] = df3.groupby(['StoreID', 'ProductID'])['Price'].transform(lambda x: x.fillna(x.mean()))
-    df3['Price_product_avg'] = df3['Price_store_avg'].fillna(df3.groupby(['ProductID'])['Price'].transform(lambda x: x.fillna(x.mean())))
-    df3['Price_imputed'] = df3['Price_product_avg'].fillna(general_avg)
-    df3 = df3.drop(['Price', 'Price_store_avg', 'Price_product_avg'], axis=1)
-
-    
-    return date_features(df3)
+    grid = pd.MultiIndex.from_product(
+        [pd.date_range(start=df['Date'].min(), end=df['Date'].max()), df['StoreID'].unique(), df['ProductID'].unique()],
+        names=keys,
+    )
+
+    sales = df.set_index(keys)[['Quantity', 'Price']]
+    if sales.index.has_duplicates:
+        raise ValueError('Several sales rows for the same Date, StoreID and ProductID')
+    imputed = sales.reindex(grid)
+
+    imputed['Quantity'] = imputed['Quantity'].fillna(0)
+
+    # the grid is a dense (date, store, product) cube, so each mean is one reduction over an axis
+    # of the price cube instead of a groupby over the rows (missing prices count as 0 in the sums)
+    prices = imputed['Price'].to_numpy().reshape([len(level) for level in grid.levels])
+    missing = np.isnan(prices)
+    filled = np.where(missing, 0, prices)
+    present = ~missing
+
+    def mean(sums, counts):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums / counts
+
+    # the reduced axes are moved to the end and made contiguous so every mean is summed like a single Series
+    by_store = np.ascontiguousarray(filled.transpose(1, 2, 0)).sum(axis=-1)
+    store_avg = mean(by_store, present.sum(axis=0))
+    by_product = np.ascontiguousarray(filled.transpose(2, 0, 1)).reshape(prices.shape[2], -1).sum(axis=-1)
+    product_avg = mean(by_product, present.sum(axis=(0, 1)))
+    general_avg = mean(filled.sum(), present.sum())
+
+    price_imputed = np.where(missing, store_avg, prices)
+    price_imputed = np.where(np.isnan(price_imputed), product_avg, price_imputed)
+    price_imputed = np.where(np.isnan(price_imputed), general_avg, price_imputed)
+    imputed['Price_imputed'] = price_imputed.reshape(-1)
+    imputed = imputed.drop(['Price'], axis=1)
+
+    if categorical_keys:
+        for level, key in enumerate(keys):
+            imputed[key] = pd.Categorical.from_codes(grid.codes[level], grid.levels[level])
+        return imputed.reset_index(drop=True)
+
+    return imputed.reset_index()
+
+
+def impute(df):
+    return date_features(impute_grid(df))
 
 
 def date_features(df):
@@ -1,174 +1,162 @@
+import os
 import pandas as pd
 from datetime import date
 import holidays
-from itertools import product
-import calendar
 import numpy as np
 
+from feature_engineering import impute_grid
 
-def impute(df):
-    df["Date"] = pd.to_datetime(df["Date"])
-    df1 = pd.DataFrame(columns=["Date", "StoreID", "ProductID"])
-    df1["Date"] = pd.date_range(start=df["Date"].min(), end=df["Date"].max())
 
-    dates = df1["Date"].unique()
-    stores = df["StoreID"].unique()
-    products = df["ProductID"].unique()
-    all = list(product(dates, stores, products))
+def impute(df):
+    df4 = weather_features(impute_grid(df))
+    df5 = date_features(df4)
+    return df5
 
-    df2 = pd.DataFrame(all, columns=["Date", "StoreID", "ProductID"])
 
-    df3 = pd.merge(
-        df2,
-        df[["Date", "StoreID", "ProductID", "Quantity", "Price"]],
-        how="left",
-        on=["Date", "StoreID", "ProductID"],
-    )
-    df3["Quantity"] = df3["Quantity"].fillna(0)
-    general_avg = df3["Price"].mean()
-    df3["Price_store_avg"] = df3.groupby(["StoreID", "ProductID"])["Price"].transform(
-        lambda x: x.fillna(x.mean())
+WEATHER_PATH = "Data/weather.csv"
+
+COPIED_WEATHER_COLUMNS = [
+    "temperature_2m_max (°C)",
+    "temperature_2m_min (°C)",
+    "temperature_2m_mean (°C)",
+    "apparent_temperature_max (°C)",
+    "apparent_temperature_min (°C)",
+    "apparent_temperature_mean (°C)",
+    "precipitation_sum (mm)",
+    "windgusts_10m_max (km/h)",
+    "windspeed_10m_max (km/h)",
+    "shortwave_radiation_sum (MJ/m²)",
+    "precipitation_hours (h)",
+]
+
+# WMO weather code => weather condition
+WEATHER_CONDITIONS = {
+    0: "no clouds developing",
+    1: "clouds dissolving",
+    2: "unchanged sky state",
+    3: "clouds developing",
+    51: "precipitation",
+    53: "precipitation",
+    55: "precipitation",
+    61: "precipitation",
+    63: "precipitation",
+    71: "precipitation",
+    73: "precipitation",
+}
+
+# path => (modification time, weather features)
+_weather_cache = {}
+
+
+def recalculate_features(weather):
+    """
+    Weather features per day. A weather file with the data of several stations needs a StoreID column
+    with the store every row belongs to, the features are then computed per store and joined by date and store.
+    """
+    keys = ["Date", "StoreID"] if "StoreID" in weather.columns else ["Date"]
+    weather_new = pd.DataFrame()
+    weather_new["Date"] = pd.to_datetime(weather["time"])
+    if "StoreID" in weather.columns:
+        weather_new["StoreID"] = weather["StoreID"]
+    for col in COPIED_WEATHER_COLUMNS:
+        weather_new[col.split(" ")[0]] = weather[col]
+
+    # residual of the evapotranspiration to its yearly sinusoid around the mean of the station,
+    # days are counted from the first row of the station
+    evapotranspiration = weather["et0_fao_evapotranspiration (mm)"]
+    if "StoreID" in weather.columns:
+        stations = weather.groupby("StoreID", sort=False)["et0_fao_evapotranspiration (mm)"]
+        days = stations.cumcount().to_numpy()
+        mean = stations.transform("mean").to_numpy()
+    else:
+        days = np.arange(len(weather))
+        mean = evapotranspiration.mean()
+    weather_new["evapotranspiration_res"] = evapotranspiration - (
+        (1.87 * np.sin(days * 2 * np.pi / 365 + 0.26 * np.pi)) + mean
     )
-    df3["Price_product_avg"] = df3["Price_store_avg"].fillna(
-        df3.groupby(["ProductID"])["Price"].transform(lambda x: x.fillna(x.mean()))
+
+    # 1 if snowfall > 0, else 0
+    weather_new["IsSnowfall"] = np.heaviside(weather["snowfall_sum (cm)"], 0)
+
+    condition = weather["weathercode (wmo code)"].map(WEATHER_CONDITIONS)
+    if condition.isna().any():
+        unknown = sorted(weather["weathercode (wmo code)"][condition.isna()].unique())
+        raise ValueError(f"Unknown weather codes: {unknown}")
+    weather_new["weather_condition"] = condition
+    weather_new = pd.get_dummies(
+        weather_new, columns=["weather_condition"], prefix=["weather"]
     )
-    df3["Price_imputed"] = df3["Price_product_avg"].fillna(general_avg)
-    df3 = df3.drop(["Price", "Price_store_avg", "Price_product_avg"], axis=1)
 
-    df4 = weather_features(df3)
-    df5 = date_features(df4)
-    return df5
+    return weather_new.set_index(keys)
 
 
-def weather_features(df):
-    weather = pd.read_csv("Data/weather.csv")
-
-    def recalculate_features(weather):
-        copied_columns = [
-            "temperature_2m_max (°C)",
-            "temperature_2m_min (°C)",
-            "temperature_2m_mean (°C)",
-            "apparent_temperature_max (°C)",
-            "apparent_temperature_min (°C)",
-            "apparent_temperature_mean (°C)",
-            "precipitation_sum (mm)",
-            "windgusts_10m_max (km/h)",
-            "windspeed_10m_max (km/h)",
-            "shortwave_radiation_sum (MJ/m²)",
-            "precipitation_hours (h)",
-        ]
-        weather_new = pd.DataFrame()
-        weather_new["Date"] = pd.to_datetime(weather["time"])
-        for col in copied_columns:
-            weather_new[col.split(" ")[0]] = weather[col]
-
-        weather_new["evapotranspiration_res"] = weather[
-            "et0_fao_evapotranspiration (mm)"
-        ] - weather.index.to_series().apply(
-            lambda x: (1.87 * np.sin(x * 2 * np.pi / 365 + 0.26 * np.pi))
-            + np.mean(weather["et0_fao_evapotranspiration (mm)"])
-        )
-
-        # 1 if snowfall > 0, else 0
-        weather_new["IsSnowfall"] = np.heaviside(weather["snowfall_sum (cm)"], 0)
-
-        wcode_map = {
-            0: "no clouds developing",
-            1: "clouds dissolving",
-            2: "unchanged sky state",
-            3: "clouds developing",
-            51: "precipitation",
-            53: "precipitation",
-            55: "precipitation",
-            61: "precipitation",
-            63: "precipitation",
-            71: "precipitation",
-            73: "precipitation",
-        }
-
-        weather_new["weather_condition"] = weather["weathercode (wmo code)"].apply(
-            lambda x: wcode_map[x]
-        )
-        weather_new = pd.get_dummies(
-            weather_new, columns=["weather_condition"], prefix=["weather"]
-        )
-
-        return weather_new
-
-    weather_features = recalculate_features(weather)
-    return pd.merge(
-        df,
-        weather_features,
-        how="left",
-        on=["Date"],
-    )
+def load_weather_features(path=WEATHER_PATH):
+    """
+    Weather features of the weather file, parsed again only when the file got modified.
+    """
+    modified = os.stat(path).st_mtime_ns
+    if path not in _weather_cache or _weather_cache[path][0] != modified:
+        _weather_cache[path] = (modified, recalculate_features(pd.read_csv(path)))
+    return _weather_cache[path][1]
+
+
+def weather_features(df, path=WEATHER_PATH):
+    weather = load_weather_features(path)
+    return df.join(weather, on=weather.index.names, how="left")
 
-    return df
+
+# month => season, index 0 is unused
+SEASONS = np.array(
+    [
+        "",
+        "Winter",
+        "Winter",
+        "Spring",
+        "Spring",
+        "Spring",
+        "Summer",
+        "Summer",
+        "Summer",
+        "Autumn",
+        "Autumn",
+        "Autumn",
+        "Winter",
+    ]
+)
 
 
 def date_features(df):
     df["Date"] = pd.to_datetime(df["Date"])
-    df["Year"] = df["Date"].dt.strftime("%Y").astype(int)
-    df["Month"] = df["Date"].dt.strftime("%m").astype(int)
-    df["DayoftheMonth"] = df["Date"].dt.strftime("%d").astype(int)
-
-    df["WeekoftheMonth"] = (
-        df["DayoftheMonth"]
-        .apply(lambda x: ((int(x) - 1) // 7) + 1)
-        .apply(lambda x: x if x <= 4 else 4)
-        .astype(int)
-    )
+    dates = df["Date"].dt
+    df["Year"] = dates.year.astype(int)
+    df["Month"] = dates.month.astype(int)
+    df["DayoftheMonth"] = dates.day.astype(int)
 
-    # df["DayoftheWeek"] = (
-    #     df["DayoftheMonth"]
-    #     .apply(
-    #         lambda x: 7
-    #         if int(x) % 7 == 0
-    #         else 7 + (int(x) - 28)
-    #         if int(x) > 28
-    #         else int(x) % 7
-    #     )
-    #     .astype(int)
-    # )
+    df["WeekoftheMonth"] = np.minimum((df["DayoftheMonth"] - 1) // 7 + 1, 4).astype(int)
 
-    df["DayoftheWeek"] = df["Date"].dt.strftime("%w").astype(int)
+    # 0 => Sunday, like strftime("%w")
+    df["DayoftheWeek"] = ((dates.dayofweek + 1) % 7).astype(int)
 
-    df["WeekoftheYear"] = df["Date"].dt.strftime("%U").astype(int)
-    df["DayoftheYear"] = df["Date"].dt.strftime("%j").astype(int)
+    # week of the year starting on Sundays, like strftime("%U")
+    df["WeekoftheYear"] = ((dates.dayofyear + 6 - df["DayoftheWeek"]) // 7).astype(int)
+    df["DayoftheYear"] = dates.dayofyear.astype(int)
 
-    df["DayName"] = df["Date"].dt.day_name()
-    df["isWeekend"] = df["DayName"].isin(["Saturday", "Sunday"])
+    df["isWeekend"] = dates.dayofweek >= 5
 
-    df["isWeekStart"] = df["DayoftheWeek"].apply(
-        lambda x: True if int(x) == 1 else False
-    )
-    df["isWeekEnd"] = df["DayoftheWeek"].apply(lambda x: True if int(x) == 7 else False)
-    df["isMonthStart"] = df["DayoftheMonth"].apply(
-        lambda x: True if int(x) == 1 else False
-    )
-    df["isMonthEnd"] = df["Date"].apply(
-        lambda x: True if x.day == calendar.monthrange(x.year, x.month)[1] else False
-    )
+    df["isWeekStart"] = df["DayoftheWeek"] == 1
+    df["isWeekEnd"] = df["DayoftheWeek"] == 7
+    df["isMonthStart"] = df["DayoftheMonth"] == 1
+    df["isMonthEnd"] = dates.is_month_end
 
-    def get_season(date):
-        year = date.year
-        if date.month >= 3 and date.month <= 5:
-            return f"Spring"
-        elif date.month >= 6 and date.month <= 8:
-            return f"Summer"
-        elif date.month >= 9 and date.month <= 11:
-            return f"Autumn"
-        else:
-            return f"Winter"
-
-    df["Season"] = df["Date"].apply(get_season)
+    df["Season"] = SEASONS[df["Month"]]
 
     df = pd.get_dummies(df, columns=["Season"], prefix=["Season"])
 
+    # look up every date only once
     de_holidays = holidays.Germany(years=[2020, 2021, 2022, 2023])
-    df["isHoliday"] = [True if x in de_holidays else False for x in df["Date"]]
-
-    df = df.drop(["DayName"], axis=1)
+    unique_dates = df["Date"].drop_duplicates()
+    holiday_dates = unique_dates[[date in de_holidays for date in unique_dates]]
+    df["isHoliday"] = df["Date"].isin(holiday_dates)
 
     return df
 
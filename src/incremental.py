@@ -0,0 +1,113 @@
+"""
+Updates the cleaned data, the imputed data and the weekly sums with the reports of Data/Raw/text that are new
+since the last run, instead of rerunning data_loader, feature_engineering_w and data_separator from scratch.
+
+The ingested reports are recorded with their content hash in Data/Raw/manifest.json. Everything is rebuilt when
+the manifest is missing or when a recorded report changed or disappeared. The cleaned data is sorted by all its
+columns, so new reports can be ingested in any order.
+
+Usage (from the repository root):
+    python src/incremental.py
+    python src/incremental.py --full
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from data_loader import load_reports, clean_data
+from data_separator import weekly_sums, update_weekly_sums
+from feature_engineering_w import impute
+
+FOLDER_PATH = 'Data/Raw/text'
+MANIFEST_PATH = 'Data/Raw/manifest.json'
+CLEANED_PATH = 'Data/merged_cleaned.csv'
+IMPUTED_PATH = 'Data/merged_cleaned_FE_imputed(v)_w.csv'
+WEEKLY_SUM_PATH = 'Data/Products/{}/weekly_sum.csv'
+COLUMN_NAMES = ['Date', 'StoreID', 'ProductID', 'Quantity', 'Price', 'Quantity_perWeek', 'Price_Total_perOrder']
+
+
+def file_hash(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    with open(MANIFEST_PATH) as file:
+        return json.load(file)
+
+
+def save_manifest(hashes):
+    with open(MANIFEST_PATH, 'w') as file:
+        json.dump(hashes, file, indent=2, sort_keys=True)
+
+
+def new_reports(manifest, hashes):
+    '''
+    Returns the file names that have to be ingested, or None when everything has to be rebuilt.
+    '''
+    if manifest is None or any(hashes.get(filename) != digest for filename, digest in manifest.items()):
+        return None
+    return sorted(set(hashes) - set(manifest))
+
+
+def load_weekly_sums(cleaned, maps):
+    '''
+    The stored weekly sums of the stores of the cleaned data, the sums of a store without a weekly_sum.csv
+    are computed from its cleaned sales.
+    '''
+    stores = []
+    for store_id in cleaned['StoreID'].unique():
+        if os.path.exists(WEEKLY_SUM_PATH.format(store_id)):
+            stores.append(pd.read_csv(WEEKLY_SUM_PATH.format(store_id)).assign(StoreID=store_id))
+        else:
+            stores.append(weekly_sums(cleaned[cleaned['StoreID'] == store_id], maps))
+    return pd.concat(stores, ignore_index=True)[['StoreID', 'ProductID', 'EAN', 'WeekoftheYear', 'Quantity_sum']]
+
+
+def save_weekly_sums(weekly):
+    for store_id, group in weekly.groupby('StoreID'):
+        os.makedirs(os.path.dirname(WEEKLY_SUM_PATH.format(store_id)), exist_ok=True)
+        group.drop(columns=['StoreID']).to_csv(WEEKLY_SUM_PATH.format(store_id), index=False)
+
+
+def update(full=False, jobs=None):
+    hashes = {filename: file_hash(os.path.join(FOLDER_PATH, filename)) for filename in os.listdir(FOLDER_PATH)}
+    new = None if full else new_reports(load_manifest(), hashes)
+    if new == []:
+        print('No new reports')
+        return
+
+    maps = pd.read_csv('Data/products_map.csv').set_index('EAN')['Nummer'].to_dict()
+    if new is None:
+        print('Rebuilding from {} reports'.format(len(hashes)))
+        sales, rows = load_reports(FOLDER_PATH, COLUMN_NAMES, jobs)
+        sales = clean_data(sales, rows, CLEANED_PATH)
+        weekly = weekly_sums(sales, maps)
+    else:
+        print('Ingesting {} new reports'.format(len(new)))
+        new_sales, rows = load_reports(FOLDER_PATH, COLUMN_NAMES, jobs, filenames=new)
+        # the cleaned data is already sorted and without duplicates, appending the later reports and sorting
+        # again keeps the order a full rebuild would give
+        cleaned = pd.read_csv(CLEANED_PATH, parse_dates=['Date'], float_precision='round_trip')
+        sales = clean_data(pd.concat([cleaned, new_sales], ignore_index=True), destination=CLEANED_PATH)
+        weekly = update_weekly_sums(load_weekly_sums(cleaned, maps), sales, new_sales, maps)
+
+    # a new week extends every store/product series, so every imputed price mean changes; they are one
+    # vectorized reduction over the price grid, which is cheaper than patching the rows that depend on them
+    impute(sales.copy()).to_csv(IMPUTED_PATH, index=False)
+    save_weekly_sums(weekly)
+    save_manifest(hashes)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true', help='rebuild everything from all the reports')
+    parser.add_argument('--jobs', type=int, default=None, help='processes parsing the reports (all cpus by default)')
+    args = parser.parse_args()
+    update(args.full, args.jobs)